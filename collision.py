@@ -0,0 +1,171 @@
+# Forward kinematics and collision checking, kept free of ev3dev imports for easy unit testing
+import math
+
+
+class OccupancyGrid(object):
+    """ voxel grid of the space around the arm, one byte per cell, 1 meaning occupied
+
+    Coordinates are in mm: x/y centered on the waist axis, z up from the work surface. Everything
+    outside the grid counts as occupied, so it doubles as the workspace boundary.
+    """
+
+    def __init__(self, radius=600, height=700, resolution=20, floor=-40):
+        self.resolution = float(resolution)
+        self.min_x = self.min_y = -radius
+        self.min_z = floor
+        self.nx = self.ny = int(math.ceil(2 * radius / self.resolution))
+        self.nz = int(math.ceil((height - floor) / self.resolution))
+        self.cells = bytearray(self.nx * self.ny * self.nz)
+
+    def index(self, x, y, z):
+        """ flat index of the cell containing (x, y, z), or -1 when outside the grid """
+        i = int((x - self.min_x) / self.resolution)
+        j = int((y - self.min_y) / self.resolution)
+        k = int((z - self.min_z) / self.resolution)
+        if x < self.min_x or y < self.min_y or z < self.min_z or i >= self.nx or j >= self.ny or k >= self.nz:
+            return -1
+        return (k * self.ny + j) * self.nx + i
+
+    def occupied(self, x, y, z):
+        index = self.index(x, y, z)
+        return index < 0 or self.cells[index] == 1
+
+    def _cell_centers(self, min_corner, max_corner):
+        """ yield (index, x, y, z) of the cells overlapping the given bounding box """
+        def cell_range(low, high, minimum, count):
+            start = max(0, int((low - minimum) / self.resolution))
+            stop = min(count, int((high - minimum) / self.resolution) + 1)
+            return range(start, stop)
+
+        for k in cell_range(min_corner[2], max_corner[2], self.min_z, self.nz):
+            z = self.min_z + (k + 0.5) * self.resolution
+            for j in cell_range(min_corner[1], max_corner[1], self.min_y, self.ny):
+                y = self.min_y + (j + 0.5) * self.resolution
+                for i in cell_range(min_corner[0], max_corner[0], self.min_x, self.nx):
+                    yield (k * self.ny + j) * self.nx + i, self.min_x + (i + 0.5) * self.resolution, y, z
+
+    def add_box(self, min_corner, max_corner):
+        """ mark all cells with their center inside the box as occupied """
+        for index, x, y, z in self._cell_centers(min_corner, max_corner):
+            if (min_corner[0] <= x <= max_corner[0] and min_corner[1] <= y <= max_corner[1]
+                    and min_corner[2] <= z <= max_corner[2]):
+                self.cells[index] = 1
+
+    def add_cylinder(self, radius, bottom, top, center=(0, 0)):
+        """ mark all cells with their center inside the vertical cylinder as occupied """
+        min_corner = (center[0] - radius, center[1] - radius, bottom)
+        max_corner = (center[0] + radius, center[1] + radius, top)
+        for index, x, y, z in self._cell_centers(min_corner, max_corner):
+            if bottom <= z <= top and (x - center[0]) ** 2 + (y - center[1]) ** 2 <= radius * radius:
+                self.cells[index] = 1
+
+
+class ArmGeometry(object):
+    """ link lengths (mm) and joint conventions of the arm
+
+    Joint angles are in degrees at the joint (motor degrees divided by the gear ratio):
+    - waist: rotation around the vertical axis
+    - shoulder: upper arm lean from vertical, positive is forwards
+    - elbow: forearm angle relative to perpendicular to the upper arm, positive is up
+    - pitch: hand angle relative to the forearm, positive is up
+    """
+
+    def __init__(self, shoulder_height=190, upper_arm=220, forearm=190, hand=150):
+        self.shoulder_height = shoulder_height
+        self.upper_arm = upper_arm
+        self.forearm = forearm
+        self.hand = hand
+
+
+class CollisionChecker(object):
+    """ check the arm pose against an occupancy grid and scale down velocities that would collide
+
+    Forward kinematics gives the elbow, wrist and grabber tip; points along the forearm and hand
+    are looked up in the grid (the upper arm is mounted on the base, so it isn't checked). The
+    sample fractions along each link are precomputed, a check only does arithmetic and indexing.
+    """
+
+    def __init__(self, grid, geometry, samples_per_link=8, lookahead=0.3, scales=(0.25, 0.5, 0.75, 1.0)):
+        self.grid = grid
+        self.geometry = geometry
+        self.fractions = tuple(i / float(samples_per_link) for i in range(1, samples_per_link + 1))
+        self.lookahead = lookahead
+        self.scales = scales
+        self.last_clear = None
+
+    def collisions(self, waist, shoulder, elbow, pitch):
+        """ number of sampled points on the forearm and hand that are in occupied cells """
+        geometry = self.geometry
+        grid = self.grid
+        cells = grid.cells
+
+        # Planar chain in the arm's vertical plane: r is the horizontal reach, z the height
+        upper_arm_elevation = math.radians(90 - shoulder)
+        forearm_elevation = upper_arm_elevation - math.pi / 2 + math.radians(elbow)
+        hand_elevation = forearm_elevation + math.radians(pitch)
+
+        elbow_r = geometry.upper_arm * math.cos(upper_arm_elevation)
+        elbow_z = geometry.shoulder_height + geometry.upper_arm * math.sin(upper_arm_elevation)
+        forearm_r = geometry.forearm * math.cos(forearm_elevation)
+        forearm_z = geometry.forearm * math.sin(forearm_elevation)
+        wrist_r = elbow_r + forearm_r
+        wrist_z = elbow_z + forearm_z
+        hand_r = geometry.hand * math.cos(hand_elevation)
+        hand_z = geometry.hand * math.sin(hand_elevation)
+
+        cos_waist = math.cos(math.radians(waist))
+        sin_waist = math.sin(math.radians(waist))
+
+        count = 0
+        for fraction in self.fractions:
+            r = elbow_r + forearm_r * fraction
+            index = grid.index(r * cos_waist, r * sin_waist, elbow_z + forearm_z * fraction)
+            if index < 0 or cells[index]:
+                count += 1
+            r = wrist_r + hand_r * fraction
+            index = grid.index(r * cos_waist, r * sin_waist, wrist_z + hand_z * fraction)
+            if index < 0 or cells[index]:
+                count += 1
+        return count
+
+    def scale(self, angles, velocities):
+        """ return the factor (1.0 down to 0.0) to scale joint velocities by to stay clear
+
+        `angles` and `velocities` are (waist, shoulder, elbow, pitch) in degrees and degrees per
+        second. The poses reached after each of the scales times the lookahead are checked from
+        short to long, so a fast motion can't skip over an obstacle.
+
+        When the arm is already in collision (e.g. it was moved by hand), only motions back towards
+        the last collision free pose are allowed, or ones that reduce the collision if there is none.
+        """
+        waist, shoulder, elbow, pitch = angles
+        waist_velocity, shoulder_velocity, elbow_velocity, pitch_velocity = velocities
+        current = self.collisions(waist, shoulder, elbow, pitch)
+
+        if current:
+            if self.last_clear is not None:
+                towards_clear = sum(velocity * (clear - angle) for velocity, clear, angle
+                                    in zip(velocities, self.last_clear, angles))
+                return 1.0 if towards_clear > 0 else 0.0
+            t = self.lookahead
+            predicted = self.collisions(waist + waist_velocity * t, shoulder + shoulder_velocity * t,
+                                        elbow + elbow_velocity * t, pitch + pitch_velocity * t)
+            return 1.0 if predicted < current else 0.0
+
+        self.last_clear = angles
+        allowed = 0.0
+        for scale in self.scales:
+            t = self.lookahead * scale
+            if self.collisions(waist + waist_velocity * t, shoulder + shoulder_velocity * t,
+                               elbow + elbow_velocity * t, pitch + pitch_velocity * t):
+                break
+            allowed = scale
+        return allowed
+
+
+def build_grid(base_radius=110, base_height=150, table_clearance=10, radius=600, height=800, resolution=20):
+    """ occupancy grid with the arm's base and the work surface it stands on """
+    grid = OccupancyGrid(radius=radius, height=height, resolution=resolution)
+    grid.add_box((-radius, -radius, grid.min_z), (radius, radius, table_clearance))
+    grid.add_cylinder(base_radius, grid.min_z, base_height)
+    return grid
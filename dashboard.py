@@ -0,0 +1,189 @@
+# Live web dashboard, kept free of ev3dev imports for easy unit testing
+import json
+import queue
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+PAGE = b"""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>EV3 robot arm</title>
+<style>
+body { font-family: sans-serif; margin: 2em; }
+td, th { padding: 0.2em 1em; text-align: right; }
+th { text-align: left; }
+#status { color: #888; }
+</style>
+</head>
+<body>
+<h1>EV3 robot arm</h1>
+<p id="status">connecting...</p>
+<table id="state"></table>
+<script>
+var state = {};
+var rows = {};
+var source = new EventSource('/events');
+source.onopen = function() { document.getElementById('status').textContent = 'live'; };
+source.onerror = function() { document.getElementById('status').textContent = 'disconnected, retrying...'; };
+source.onmessage = function(event) {
+    var changes = JSON.parse(event.data);
+    var table = document.getElementById('state');
+    Object.keys(changes).sort().forEach(function(key) {
+        state[key] = changes[key];
+        if (!rows[key]) {
+            var row = table.insertRow(-1);
+            row.insertCell(0).outerHTML = '<th>' + key + '</th>';
+            rows[key] = row.insertCell(1);
+        }
+        rows[key].textContent = changes[key] === null ? '-' : changes[key];
+    });
+};
+</script>
+</body>
+</html>
+"""
+
+
+_MISSING = object()
+
+
+def delta(previous, current):
+    """ the entries of `current` that are new or differ from `previous` """
+    return {key: value for key, value in current.items() if previous.get(key, _MISSING) != value}
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class Dashboard(threading.Thread):
+    """ serve a page showing the arm state, kept up to date with Server-Sent Events
+
+    While there are clients, the publishing thread calls `snapshot()` at most `max_rate` times per
+    second. `snapshot()` returns a flat dict of values. Only the entries that changed since the previous
+    frame are encoded, once, and queued to every client; a new client first gets the full state of
+    that previous frame.
+    Clients that can't keep up are disconnected instead of building a backlog.
+    """
+
+    def __init__(self, snapshot, port=8080, max_rate=5, address='', keepalive=15, client_queue_size=10):
+        threading.Thread.__init__(self, name='Dashboard')
+        self.daemon = True
+        self.snapshot = snapshot
+        self.interval = 1.0 / max_rate
+        self.keepalive = keepalive
+        self.client_queue_size = client_queue_size
+        self.state = {}
+        self.clients = []
+        self.clients_lock = threading.Lock()
+        self.frames = 0
+        self.running = True
+        self.server = _Server((address, port), self._handler())
+        self.port = self.server.server_address[1]
+        self._server_thread = threading.Thread(target=self.server.serve_forever, name='DashboardServer')
+        self._server_thread.daemon = True
+
+    def _handler(self):
+        dashboard = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass  # don't log every request
+
+            def do_GET(self):
+                if self.path == '/':
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/html; charset=utf-8')
+                    self.send_header('Content-Length', str(len(PAGE)))
+                    self.end_headers()
+                    self.wfile.write(PAGE)
+                elif self.path == '/events':
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/event-stream')
+                    self.send_header('Cache-Control', 'no-cache')
+                    self.end_headers()
+                    dashboard.stream(self.wfile)
+                else:
+                    self.send_error(404)
+
+        return Handler
+
+    def stream(self, wfile):
+        """ send the full state and then every published delta to a client until it disconnects """
+        client = queue.Queue(self.client_queue_size)
+        with self.clients_lock:
+            # the last published state, which all following deltas are relative to
+            client.put(self.encode(self.state))
+            self.clients.append(client)
+        try:
+            while self.running:
+                try:
+                    message = client.get(timeout=self.keepalive)
+                except queue.Empty:
+                    message = b': keepalive\n\n'
+                if message is None or client not in self.clients:
+                    break
+                wfile.write(message)
+                wfile.flush()
+        except (OSError, socket.error):
+            pass  # client went away
+        finally:
+            with self.clients_lock:
+                if client in self.clients:
+                    self.clients.remove(client)
+
+    @staticmethod
+    def encode(changes):
+        return 'data: {}\n\n'.format(json.dumps(changes, separators=(',', ':'), sort_keys=True)).encode('utf-8')
+
+    def publish(self):
+        """ take a snapshot and queue what changed to all clients """
+        current = self.snapshot()
+        with self.clients_lock:
+            changes = delta(self.state, current)
+            self.state = current
+            if not changes:
+                return None
+            message = self.encode(changes)
+            self.frames += 1
+            for client in list(self.clients):
+                try:
+                    client.put_nowait(message)
+                except queue.Full:
+                    # too slow, drop it; the browser reconnects and starts from the full state
+                    self.clients.remove(client)
+        return changes
+
+    def run(self):
+        self._server_thread.start()
+        next_frame = time.time()
+        while self.running:
+            if self.clients:
+                try:
+                    self.publish()
+                except Exception:
+                    pass  # a failing sensor read shouldn't kill the dashboard
+            next_frame += self.interval
+            delay = next_frame - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_frame = time.time()
+
+    def stop(self):
+        self.running = False
+        with self.clients_lock:
+            for client in self.clients:
+                try:
+                    client.put_nowait(None)
+                except queue.Full:
+                    pass
+            del self.clients[:]
+        if self._server_thread.is_alive():
+            self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,128 @@
+# Emergency stop helpers, kept free of ev3dev/rpyc imports for easy unit testing
+import threading
+import time
+
+
+def stop_motors(motors, confirm_timeout=0.1, poll_interval=0.01):
+    """ stop all motors at once, read back their state and reset the ones that don't confirm
+
+    This function is self-contained on purpose: it is teleported to the secondary EV3 with
+    rpyc.classic.teleport_function() so all remote motors get stopped by a single RPyC call.
+    Returns a tuple of (confirmed, escalated, latency) tuples, one per motor.
+    """
+    import time
+
+    start = time.time()
+    for motor in motors:
+        try:
+            motor.stop()
+        except Exception:
+            pass
+
+    confirmed = [False] * len(motors)
+    latency = [0.0] * len(motors)
+    while True:
+        for index, motor in enumerate(motors):
+            if confirmed[index]:
+                continue
+            try:
+                if not motor.is_running:
+                    confirmed[index] = True
+                    latency[index] = time.time() - start
+            except Exception:
+                pass
+        if all(confirmed) or time.time() - start >= confirm_timeout:
+            break
+        time.sleep(poll_interval)
+
+    # Escalate: a reset stops the motor regardless of the stop_action / command it's stuck on
+    escalated = [False] * len(motors)
+    for index, motor in enumerate(motors):
+        if not confirmed[index]:
+            escalated[index] = True
+            try:
+                motor.reset()
+            except Exception:
+                pass
+            latency[index] = time.time() - start
+
+    return tuple(zip(confirmed, escalated, latency))
+
+
+class BrickStop(object):
+    """ the stop request for a single brick: which motors, how to stop them and what to do on a timeout """
+
+    def __init__(self, name, motor_names, stop, on_timeout=None):
+        self.name = name
+        self.motor_names = motor_names
+        self.stop = stop
+        self.on_timeout = on_timeout
+
+
+class BrickStopReport(object):
+    """ the outcome of stopping a single brick """
+
+    def __init__(self, name, motor_names):
+        self.name = name
+        self.motor_names = motor_names
+        self.results = None
+        self.error = None
+        self.timed_out = False
+        self.latency = None
+
+    @property
+    def unconfirmed(self):
+        """ names of motors that did not confirm stop (unknown when the brick timed out) """
+        if self.results is None:
+            return list(self.motor_names)
+        return [name for name, result in zip(self.motor_names, self.results) if not result[0]]
+
+    @property
+    def ok(self):
+        return not self.timed_out and self.error is None and not self.unconfirmed
+
+
+def emergency_stop(bricks, deadline=0.5):
+    """ stop all bricks in parallel, waiting at most `deadline` seconds for each to confirm
+
+    Bricks that don't answer within the deadline get their on_timeout() escalation called
+    (e.g. dropping the RPyC connection). Returns a list of BrickStopReport.
+    """
+    reports = [BrickStopReport(brick.name, brick.motor_names) for brick in bricks]
+    threads = []
+    lock = threading.Lock()
+    start = time.time()
+
+    def run(brick, report):
+        results = error = None
+        try:
+            results = brick.stop()
+        except Exception as e:
+            error = e
+        with lock:
+            if report.timed_out:
+                return  # too late, the report has already been handed out
+            report.results = results
+            report.error = error
+            report.latency = time.time() - start
+
+    for brick, report in zip(bricks, reports):
+        thread = threading.Thread(target=run, args=(brick, report), name='estop-{}'.format(brick.name))
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+
+    for brick, report, thread in zip(bricks, reports, threads):
+        thread.join(max(0.0, deadline - (time.time() - start)))
+        with lock:
+            if report.latency is None:
+                report.timed_out = True
+                report.latency = time.time() - start
+        if report.timed_out:
+            if brick.on_timeout:
+                try:
+                    brick.on_timeout()
+                except Exception as e:
+                    report.error = e
+
+    return reports
@@ -0,0 +1,115 @@
+# Logging setup with an in-memory flight recorder, kept free of ev3dev imports for easy unit testing
+import atexit
+import itertools
+import logging
+import queue
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+
+class FlightRecorder(object):
+    """ preallocated ring buffer holding the most recent events as unformatted tuples
+
+    record() only stores a (timestamp, level, message, args) tuple, so it's cheap enough to call from
+    the control loop. Formatting is deferred until the buffer gets dumped.
+    """
+
+    def __init__(self, size=8192):
+        self.size = size
+        self._events = [None] * size
+        # next() on itertools.count is atomic, so concurrent writers never get the same slot
+        self._counter = itertools.count()
+
+    def record(self, message, *args, level=logging.DEBUG):
+        self._events[next(self._counter) % self.size] = (time.time(), level, message, args)
+
+    def events(self, seconds=None):
+        """ return the recorded events oldest first, optionally only those of the last `seconds` """
+        events = [event for event in self._events if event is not None]
+        events.sort(key=lambda event: event[0])
+        if seconds is not None:
+            since = time.time() - seconds
+            events = [event for event in events if event[0] >= since]
+        return events
+
+    def format_events(self, seconds=None):
+        lines = []
+        for timestamp, level, message, args in self.events(seconds):
+            try:
+                text = message % args if args else message
+            except (TypeError, ValueError):
+                text = '{} {}'.format(message, args)
+            lines.append('{:.3f} {} {}'.format(timestamp, logging.getLevelName(level), text))
+        return lines
+
+    def dump(self, path, seconds=None):
+        """ write the recorded events (of the last `seconds`) to a file """
+        with open(path, 'w') as f:
+            for line in self.format_events(seconds):
+                f.write(line + '\n')
+        return path
+
+
+class FlightRecorderHandler(logging.Handler):
+    """ logging handler that copies every record into the flight recorder without formatting it """
+
+    def __init__(self, recorder):
+        logging.Handler.__init__(self)
+        self.recorder = recorder
+
+    def emit(self, record):
+        self.recorder.record(record.msg, *(record.args or ()), level=record.levelno)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """ QueueHandler that leaves formatting to the listener thread instead of the calling thread """
+
+    def prepare(self, record):
+        return record
+
+
+def setup_logging(recorder, level=logging.INFO, stream=sys.stdout, fmt='%(message)s'):
+    """ log through a background thread that does the formatting and I/O, and into the recorder """
+    log_queue = queue.Queue()
+    stream_handler = logging.StreamHandler(stream)
+    stream_handler.setFormatter(logging.Formatter(fmt))
+    listener = QueueListener(log_queue, stream_handler)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(DeferredQueueHandler(log_queue))
+    root.addHandler(FlightRecorderHandler(recorder))
+    return listener
+
+
+def dump_on_exception(recorder, path_pattern, seconds=None):
+    """ dump the recorder whenever an exception goes unhandled, in any thread """
+    def dump():
+        path = time.strftime(path_pattern)
+        recorder.dump(path, seconds)
+        logging.getLogger(__name__).error('Flight recorder dumped to %s', path)
+
+    previous_excepthook = sys.excepthook
+
+    def excepthook(exc_type, exc_value, exc_traceback):
+        recorder.record('Unhandled exception: %r', exc_value, level=logging.CRITICAL)
+        dump()
+        previous_excepthook(exc_type, exc_value, exc_traceback)
+
+    sys.excepthook = excepthook
+
+    # threading.excepthook only exists on Python 3.8+
+    if hasattr(threading, 'excepthook'):
+        previous_threading_excepthook = threading.excepthook
+
+        def threading_excepthook(args):
+            recorder.record('Unhandled exception in %s: %r', args.thread.name if args.thread else None,
+                            args.exc_value, level=logging.CRITICAL)
+            dump()
+            previous_threading_excepthook(args)
+
+        threading.excepthook = threading_excepthook
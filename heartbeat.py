@@ -0,0 +1,55 @@
+# Supervisor heartbeat sent by each arm, kept free of ev3dev imports for easy unit testing
+import json
+import os
+import socket
+import threading
+import time
+
+
+def parse_address(address):
+    """ 'host:port' to a (host, port) tuple """
+    host, _, port = address.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+class Heartbeat(threading.Thread):
+    """ send `status()` to the supervisor every `interval` seconds
+
+    Nothing is sent while `status()` returns None (or raises), so an arm whose control loop is stuck
+    goes quiet and gets restarted even though the process itself is still alive.
+    """
+
+    def __init__(self, address, name, status, interval=0.5):
+        threading.Thread.__init__(self, name='Heartbeat')
+        self.daemon = True
+        self.address = address
+        self.arm = name
+        self.status = status
+        self.interval = interval
+        self.sequence = 0
+        self.running = True
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send(self):
+        try:
+            status = self.status()
+        except Exception:
+            status = None
+        if status is None:
+            return False
+        message = {'name': self.arm, 'pid': os.getpid(), 'sequence': self.sequence, 'status': status}
+        self.sequence += 1
+        try:
+            self.sock.sendto(json.dumps(message).encode('utf-8'), self.address)
+        except (OSError, socket.error):
+            return False  # the supervisor may be restarting, keep trying
+        return True
+
+    def run(self):
+        while self.running:
+            self.send()
+            time.sleep(self.interval)
+        self.sock.close()
+
+    def stop(self):
+        self.running = False
@@ -0,0 +1,180 @@
+# Task level motion scheduling, kept free of ev3dev imports for easy unit testing
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Joint(object):
+    """ a motor the scheduler can move to a position
+
+    `start(position, speed)` starts a move without blocking, `state()` returns the current
+    (position, running) or None when it's unknown right now. `stalled()`, if given, tells whether
+    the motor is blocked by something, which is how a grip move finishes.
+    """
+
+    def __init__(self, name, brick, start, state, stop=None, tolerance=10, stalled=None):
+        self.name = name
+        self.brick = brick
+        self.start = start
+        self.state = state
+        self.stop = stop
+        self.tolerance = tolerance
+        self.stalled = stalled
+
+    def reached(self, position):
+        state = self.state()
+        if state is None:
+            return False
+        current, running = state
+        return not running and abs(current - position) <= self.tolerance
+
+
+class Move(object):
+    """ move a joint to a position, after the given other moves have finished
+
+    A `grip` move also finishes when the joint stalls on the way, e.g. a grabber closing on an object
+    before reaching the closed position; the joint is then stopped where it is to hold the grip.
+    """
+
+    def __init__(self, joint, position, speed, after=(), grip=False):
+        self.joint = joint
+        self.position = position
+        self.speed = speed
+        self.after = list(after)
+        self.grip = grip
+        self.started = None
+        self.finished = None
+        self.timed_out = False
+        self.gripped = False
+
+    def __repr__(self):
+        return 'Move({}, {})'.format(self.joint, self.position)
+
+
+class Task(object):
+    """ a named set of moves, e.g. picking up an object """
+
+    def __init__(self, name, moves):
+        self.name = name
+        self.moves = moves
+        self.reported = False
+
+    @property
+    def started(self):
+        started = [move.started for move in self.moves if move.started is not None]
+        return min(started) if started else None
+
+    @property
+    def finished(self):
+        if any(move.finished is None for move in self.moves):
+            return None
+        return max(move.finished for move in self.moves)
+
+    @property
+    def cycle_time(self):
+        """ seconds from the first move starting to the last one finishing """
+        if self.started is None or self.finished is None:
+            return None
+        return self.finished - self.started
+
+
+class MotionAborted(Exception):
+    """ a move timed out or the abort check fired; all joints were stopped and nothing else started """
+
+    def __init__(self, reason, move=None):
+        Exception.__init__(self, reason)
+        self.move = move
+
+
+class MotionScheduler(object):
+    """ run queued tasks, overlapping all moves that don't depend on each other
+
+    Each move depends on the moves listed in its `after`, and on the previous move of the same joint
+    (in this or an earlier task). Everything else runs concurrently: moves on the two bricks, and the
+    next task's joints that the current task is already done with. Moves are started without blocking
+    and polled for completion, so a single thread drives both bricks.
+
+    When a move doesn't finish within `move_timeout`, or `abort_check()` returns a reason, all running
+    joints are stopped and MotionAborted is raised: the moves depending on it never start.
+    """
+
+    def __init__(self, joints, poll_interval=0.02, move_timeout=10, abort_check=None):
+        self.joints = {joint.name: joint for joint in joints}
+        self.poll_interval = poll_interval
+        self.move_timeout = move_timeout
+        self.abort_check = abort_check
+
+    def dependencies(self, tasks):
+        """ map every move to the moves it has to wait for """
+        dependencies = {}
+        last_move = {}
+        for task in tasks:
+            for move in task.moves:
+                depends_on = set(move.after)
+                if move.joint in last_move:
+                    depends_on.add(last_move[move.joint])
+                dependencies[move] = depends_on
+                last_move[move.joint] = move
+        return dependencies
+
+    def run(self, tasks):
+        """ run all tasks to completion and return them with their timing filled in """
+        dependencies = self.dependencies(tasks)
+        pending = [move for task in tasks for move in task.moves]
+        running = []
+        finished = set()
+
+        while pending or running:
+            for move in list(pending):
+                if dependencies[move] <= finished:
+                    pending.remove(move)
+                    self.joints[move.joint].start(move.position, move.speed)
+                    move.started = time.time()
+                    running.append(move)
+
+            if not running and pending:
+                raise ValueError('Moves with unsatisfiable dependencies: {}'.format(pending))
+
+            time.sleep(self.poll_interval)
+
+            reason = self.abort_check() if self.abort_check else None
+            if reason:
+                self.abort(running, reason)
+
+            now = time.time()
+            for move in list(running):
+                joint = self.joints[move.joint]
+                if joint.reached(move.position):
+                    move.finished = now
+                    running.remove(move)
+                    finished.add(move)
+                elif move.grip and joint.stalled and joint.stalled():
+                    if joint.stop:
+                        joint.stop()
+                    move.gripped = True
+                    move.finished = now
+                    running.remove(move)
+                    finished.add(move)
+                elif now - move.started > self.move_timeout:
+                    move.timed_out = True
+                    self.abort(running, '{} did not reach {} within {}s'.format(
+                        move.joint, move.position, self.move_timeout), move)
+
+            for task in tasks:
+                if not task.reported and task.finished is not None:
+                    task.reported = True
+                    logger.info('Task %s finished, cycle time %.2fs', task.name, task.cycle_time)
+
+        return tasks
+
+    def abort(self, running, reason, move=None):
+        logger.error('Aborting: %s', reason)
+        for joint in set(running_move.joint for running_move in running):
+            stop = self.joints[joint].stop
+            if stop:
+                try:
+                    stop()
+                except Exception as e:
+                    logger.error('Failed to stop %s: %s', joint, e)
+        raise MotionAborted(reason, move)
@@ -19,6 +19,7 @@
 
 __author__ = 'Nino Guba'
 
+import argparse
 import logging
 import os
 import sys
@@ -38,12 +39,110 @@ from ev3dev2.power import PowerSupply
 # from ev3dev2.sound import Sound
 from evdev import InputDevice
 
+from collision import ArmGeometry, CollisionChecker, build_grid
+from dashboard import Dashboard
+from estop import BrickStop, emergency_stop, stop_motors
+from flight_recorder import FlightRecorder, dump_on_exception, setup_logging
+from heartbeat import Heartbeat, parse_address
 from math_helper import scale_stick
-
+from motion_scheduler import Joint, MotionAborted, MotionScheduler, Move, Task
+from sampling_profiler import SamplingProfiler
+from setpoint_filter import SetpointFilter
+from stall_monitor import StallMonitor
+from telemetry import (FRAME_FORMAT, HOLDING, MOTOR_NAMES, OVERLOADED, PRESENT, RUNNING, STALLED, LeaseRenewer,
+                       TelemetryMirror, local_address_for, push_state, renew_lease)
+from tilt_input import TiltInput
+
+
+# Command line options
+parser = argparse.ArgumentParser(description='Control the robot arm with a PS4 controller')
+parser.add_argument('--profile', nargs='?', const='profile-%Y%m%d-%H%M%S.collapsed', metavar='FILE',
+                    help='sample all thread stacks and write them as collapsed stacks on shutdown')
+parser.add_argument('--tilt', action='store_true',
+                    help='drive wrist pitch and roll by tilting the controller')
+parser.add_argument('--dashboard', nargs='?', type=int, const=8080, metavar='PORT',
+                    help='serve a live dashboard of the arm state on this port (default 8080)')
+parser.add_argument('--pick-place', type=int, default=0, metavar='CYCLES',
+                    help='run this many pick and place cycles before handing control to the gamepad')
+parser.add_argument('--no-collision-check', dest='collision_check', action='store_false',
+                    help="don't slow down or stop motions that would hit the base or the table")
+parser.add_argument('--name', help='name of this arm in log output and files, when running several arms')
+parser.add_argument('--remote-host', default='10.42.0.3',
+                    help='hostname or IP address of the secondary EV3 (default 10.42.0.3)')
+parser.add_argument('--gamepad', metavar='DEVICE',
+                    help='input device of the controller (default: the first wireless controller found)')
+parser.add_argument('--telemetry-port', type=int, default=5005, metavar='PORT',
+                    help='UDP port the secondary EV3 pushes its state to (default 5005)')
+parser.add_argument('--health', metavar='HOST:PORT',
+                    help='send heartbeats to a supervisor at this address, see supervisor.py')
+args = parser.parse_args()
 
 # Config
-REMOTE_HOST = '10.42.0.3'
+REMOTE_HOST = args.remote_host
 JOYSTICK_DEADZONE = 20
+ESTOP_DEADLINE = 0.5  # seconds each brick gets to confirm all its motors stopped
+MOTOR_THREAD_STOP_TIMEOUT = 0.5  # seconds to wait for the current control tick before the emergency stop
+FLIGHT_RECORDER_FILE = 'flight-recorder-' + (args.name + '-' if args.name else '') + '%Y%m%d-%H%M%S.log'
+FLIGHT_RECORDER_SECONDS = 30  # how much history to dump on shutdown or crash
+PROFILE_INTERVAL = 0.05  # seconds between stack samples in --profile mode
+
+# Control loop
+CONTROL_RATE = 50  # Hz
+MAX_ACCEL = 200  # speed % per second
+MAX_JERK = 2000  # speed % per second^2
+SPEED_QUANTUM = 2  # motor speeds are rounded to multiples of this
+
+# Tilt control
+IMU_RATE = 250  # Hz, approximate report rate of the controller's motion sensors
+TILT_OUTPUT_RATE = 25  # Hz, how often the filtered tilt is turned into new pitch/roll speeds
+TILT_DEADZONE = 15  # degrees
+TILT_FULL_ANGLE = 45  # degrees of tilt for full speed
+
+# Gear ratios (motor degrees per joint degree), see robot-arm.py
+WAIST_RATIO = 7.5
+SHOULDER_RATIO = 7.5
+ELBOW_RATIO = 5
+PITCH_RATIO = 5
+GRABBER_RATIO = 24
+
+# Max motor speeds in degrees per second at 100% speed
+LARGE_MOTOR_MAX_DPS = 1050
+MEDIUM_MOTOR_MAX_DPS = 1560
+
+# Collision checking
+COLLISION_LOOKAHEAD = 0.3  # seconds of motion to check ahead
+PITCH_POSITION_INTERVAL = 10  # ticks between direct reads of the pitch position when telemetry is stale
+
+# Telemetry pushed by the secondary EV3
+TELEMETRY_PORT = args.telemetry_port
+TELEMETRY_RATE = 20  # frames per second
+TELEMETRY_MAX_AGE = 0.25  # seconds after which the latest frame is considered stale
+TELEMETRY_LEASE = 3  # seconds the secondary EV3 keeps sending without hearing from us
+TELEMETRY_LEASE_RENEWAL = 1  # seconds between renewals
+
+# Pick and place, joint angles in degrees
+PICK_WAIST_ANGLE = -90
+PLACE_WAIST_ANGLE = 90
+REACH_SHOULDER_ANGLE = -45  # forward
+REACH_ELBOW_ANGLE = -90  # up
+REACH_PITCH_ANGLE = -45  # down
+GRABBER_CLOSED_ANGLE = -68
+PICK_PLACE_CHECK_STEPS = 10  # poses checked for collisions along each planned move
+
+# Stall detection
+STALL_MONITOR_RATE = 10  # samples per second, lowered automatically to stay within the budget
+STALL_MONITOR_BUDGET = 0.05  # max fraction of time spent sampling motor states
+STALL_SAMPLES = 3  # jammed samples in a row before a motor gets cut
+STALL_MIN_DUTY = 30  # % duty cycle above which a motor should be turning...
+STALL_MIN_SPEED = 20  # ...faster than this many degrees per second
+STALL_BACKOFF = 1.0  # seconds a jammed joint can't be driven further into the jam
+
+# Dashboard
+DASHBOARD_RATE = 5  # max frames per second sent to browsers
+
+# Supervisor heartbeat
+HEARTBEAT_INTERVAL = 0.5  # seconds
+HEARTBEAT_MAX_TICK_AGE = 1.0  # seconds without a control loop tick (or pick and place poll) before heartbeats stop
 
 # Define speeds
 FULL_SPEED = 100
@@ -54,11 +153,20 @@ VERY_SLOW_SPEED = 10
 
 # Setup logging
 os.system('setfont Lat7-Terminus12x6')
-logging.basicConfig(level=logging.INFO, stream=sys.stdout,
-                    format='%(message)s')
+# Log records are formatted and written by a background thread, and kept in an in-memory flight
+# recorder which gets dumped to a file on shutdown or when an exception goes unhandled.
+flight_recorder = FlightRecorder()
+setup_logging(flight_recorder, level=logging.INFO, stream=sys.stdout,
+              fmt='[' + args.name + '] %(message)s' if args.name else '%(message)s')
+dump_on_exception(flight_recorder, FLIGHT_RECORDER_FILE, FLIGHT_RECORDER_SECONDS)
 logger = logging.getLogger(__name__)
 
 
+def dump_flight_recorder():
+    path = flight_recorder.dump(time.strftime(FLIGHT_RECORDER_FILE), FLIGHT_RECORDER_SECONDS)
+    logger.info('Flight recorder dumped to %s', path)
+
+
 def reset_motors():
     """ reset motor positions to default """
     logger.info("Resetting motors...")
@@ -79,7 +187,7 @@ def reset_motors():
 # Create a RPyC connection to the remote ev3dev device.
 # Use the hostname or IP address of the ev3dev device.
 # If this fails, verify your IP connectivty via ``ping X.X.X.X``
-logger.info("Connecting RPyC to {}...".format(REMOTE_HOST))
+logger.info("Connecting RPyC to %s...", REMOTE_HOST)
 # change this IP address for your slave EV3 brick
 conn = rpyc.classic.connect(REMOTE_HOST)
 # remote_ev3 = conn.modules['ev3dev.ev3']
@@ -91,11 +199,30 @@ logger.info("RPyC started succesfully")
 # Gamepad
 # If bluetooth is not available, check https://github.com/ev3dev/ev3dev/issues/1314
 logger.info("Connecting wireless controller...")
-gamepad = InputDevice(evdev.list_devices()[0])
-if gamepad.name != 'Wireless Controller':
+if args.gamepad:
+    gamepad = InputDevice(args.gamepad)
+else:
+    gamepads = [InputDevice(path) for path in evdev.list_devices()]
+    gamepads = [device for device in gamepads if device.name == 'Wireless Controller'] or gamepads[:1]
+    gamepad = gamepads[0] if gamepads else None
+if gamepad is None or gamepad.name != 'Wireless Controller':
     logger.error('Failed to connect to wireless controller')
     sys.exit(1)
 
+# The controller's accelerometer/gyro is a separate input device
+tilt_input = None
+if args.tilt:
+    motion_sensors = [InputDevice(path) for path in evdev.list_devices()]
+    # with several controllers connected, the right one has the same unique id (MAC address) as the gamepad
+    motion_sensors = [device for device in motion_sensors if device.name == 'Wireless Controller Motion Sensors'
+                      and device.uniq == gamepad.uniq]
+    if motion_sensors:
+        tilt_input = TiltInput(motion_sensors[0], sample_rate=IMU_RATE, output_rate=TILT_OUTPUT_RATE,
+                               deadzone=TILT_DEADZONE, full_angle=TILT_FULL_ANGLE)
+        logger.info("Motion sensors detected, tilt control enabled!")
+    else:
+        logger.info("Motion sensors not detected - running without tilt control...")
+
 # LEDs
 leds = Leds()
 remote_leds = remote_led.Leds()
@@ -152,6 +279,80 @@ except DeviceNotFound:
     grabber_motor = False
 
 
+# State telemetry: the secondary EV3 pushes its motor states and battery levels to us at a fixed rate,
+# so reading them is a local memory read instead of an RPyC round trip.
+telemetry = TelemetryMirror(TELEMETRY_PORT, max_age=TELEMETRY_MAX_AGE)
+telemetry.start()
+remote_push_state = rpyc.classic.teleport_function(conn, push_state)
+telemetry_stop = conn.modules.threading.Event()
+# The sender stops by itself when we stop renewing its lease (crash, kill, dropped connection),
+# otherwise every restart of this script would leave another one running on the secondary EV3.
+remote_renew_lease = rpyc.classic.teleport_function(conn, renew_lease)
+telemetry_lease = conn.builtins.list((0.0,))
+remote_renew_lease(telemetry_lease, TELEMETRY_LEASE)
+telemetry_lease_renewer = LeaseRenewer(lambda: remote_renew_lease(telemetry_lease, TELEMETRY_LEASE),
+                                       TELEMETRY_LEASE_RENEWAL)
+telemetry_lease_renewer.start()
+telemetry_thread = conn.modules.threading.Thread(target=remote_push_state, args=(
+    (roll_motor, pitch_motor, spin_motor, grabber_motor or None), remote_power,
+    (local_address_for(REMOTE_HOST), telemetry.port), 1.0 / TELEMETRY_RATE, FRAME_FORMAT, telemetry_stop,
+    telemetry_lease))
+telemetry_thread.daemon = True
+telemetry_thread.start()
+logger.info("Telemetry from %s started", REMOTE_HOST)
+
+
+# Emergency stop: all motors of a brick are stopped by a single call, the remote one over one RPyC
+# round trip by running stop_motors() on the secondary EV3 itself. Motors that don't confirm the stop
+# get reset (the pitch motor used to get stuck on stop every now and then).
+remote_stop_motors = rpyc.classic.teleport_function(conn, stop_motors)
+local_estop_motors = [('waist', waist_motor), ('shoulder', shoulder_motors), ('elbow', elbow_motor)]
+remote_estop_motors = [('pitch', pitch_motor), ('roll', roll_motor), ('spin', spin_motor)]
+if grabber_motor:
+    remote_estop_motors.append(('grabber', grabber_motor))
+
+
+def reset_local_motors():
+    for _, motor in local_estop_motors:
+        try:
+            motor.reset()
+        except Exception as e:
+            logger.error('Failed to reset %s: %s', motor, e)
+
+
+def stop_all_motors():
+    """ stop both bricks in parallel and report how long it took """
+    local_motors = tuple(motor for _, motor in local_estop_motors)
+    remote_motors = tuple(motor for _, motor in remote_estop_motors)
+    reports = emergency_stop([
+        # If stopping hangs on the primary brick, reset its motors directly
+        BrickStop('primary', [name for name, _ in local_estop_motors],
+                  lambda: stop_motors(local_motors), on_timeout=reset_local_motors),
+        # If the secondary brick hangs, drop the connection rather than waiting on it
+        BrickStop('secondary', [name for name, _ in remote_estop_motors],
+                  lambda: remote_stop_motors(remote_motors), on_timeout=conn.close),
+    ], deadline=ESTOP_DEADLINE)
+
+    escalations = {'primary': 'motors reset', 'secondary': 'connection dropped'}
+    for report in reports:
+        if report.timed_out:
+            if report.error is not None:
+                logger.error('%s brick did not confirm stop within %ss, escalation failed: %s',
+                             report.name, ESTOP_DEADLINE, report.error)
+            else:
+                logger.error('%s brick did not confirm stop within %ss, %s',
+                             report.name, ESTOP_DEADLINE, escalations[report.name])
+        elif report.error is not None:
+            logger.error('%s brick failed to stop: %s', report.name, report.error)
+        else:
+            for name, (confirmed, escalated, latency) in zip(report.motor_names, report.results):
+                if escalated:
+                    logger.warning('%s motor did not confirm stop, reset after %dms', name, latency * 1000)
+        logger.info('%s brick stopped in %dms', report.name, report.latency * 1000)
+
+    return reports
+
+
 # Not sure why but resetting all motors before doing anything else seems to improve reliability
 reset_motors()
 
@@ -176,8 +377,12 @@ grabber_close = False
 running = True
 
 def log_power_info():
-    logger.info('Local battery power: {}V / {}A'.format(round(power.measured_volts,2 ), round(power.measured_amps, 2)))
-    logger.info('Remote battery power: {}V / {}A'.format(round(remote_power.measured_volts, 2), round(remote_power.measured_amps, 2)))
+    logger.info('Local battery power: %.2fV / %.2fA', power.measured_volts, power.measured_amps)
+    frame = telemetry.frame
+    if telemetry.stale:
+        logger.info('Remote battery power: %.2fV / %.2fA', remote_power.measured_volts, remote_power.measured_amps)
+    else:
+        logger.info('Remote battery power: %.2fV / %.2fA', frame.volts, frame.amps)
 
 
 speed_modifier = 0
@@ -210,7 +415,7 @@ def align_waist_to_color(waist_target_color):
     # If we're not on the correct color, start moving but make sure there's a 
     # timeout to prevent trying forever.
     if color_sensor.color != target_color:
-        logger.info('Moving to color {}...'.format(target_color))
+        logger.info('Moving to color %s...', target_color)
         waist_motor.on(NORMAL_SPEED)
 
         max_iterations = 100
@@ -224,7 +429,7 @@ def align_waist_to_color(waist_target_color):
             # prevent running forver
             iterations += 1
             if iterations >= max_iterations:
-                logger.info('Failed to align waist to requested color {}'.format(target_color))
+                logger.info('Failed to align waist to requested color %s', target_color)
                 break
         
         # we're either aligned or reached a timeout. Stop moving.
@@ -240,37 +445,54 @@ def clean_shutdown(signal_received=None, frame=None):
 
     global running
     running = False
-    
-    logger.info('waist..')
-    waist_motor.stop()
-    logger.info('shoulder..')
-    shoulder_motors.stop()
-    logger.info('elbow..')
-    elbow_motor.stop()
-    logger.info('pitch..')
-    # For some reason the pitch motor sometimes gets stuck here, and a reset helps?
-    # pitch_motor.reset()
-    pitch_motor.stop()
-    logger.info('roll..')
-    roll_motor.stop()
-    logger.info('spin..')
-    spin_motor.stop()
 
-    if grabber_motor:
-        logger.info('grabber..')
-        grabber_motor.stop()
+    # A tick that's already running could otherwise still start a motor after the stop
+    if motor_thread and motor_thread.is_alive():
+        motor_thread.join(MOTOR_THREAD_STOP_TIMEOUT)
+        if motor_thread.is_alive():
+            logger.warning('MotorThread did not stop within %ss', MOTOR_THREAD_STOP_TIMEOUT)
+
+    stop_all_motors()
+
+    stall_monitor.stop()
+
+    if heartbeat:
+        heartbeat.stop()
+
+    if dashboard:
+        dashboard.stop()
+
+    telemetry.stop()
+    telemetry_lease_renewer.stop()
+    try:
+        telemetry_stop.set()
+    except Exception:
+        pass  # the connection may have been dropped by the emergency stop
+
+    if tilt_input:
+        tilt_input.stop()
+        tilt_input.join(1)
+        tilt_input.device.close()
 
     # See https://github.com/gvalkov/python-evdev/issues/19 if this raises exceptions, but it seems 
     # stable now.
     gamepad.close()
 
     logger.info('Shutdown completed.')
+    dump_flight_recorder()
+
+    if profiler:
+        profiler.stop()
+        profiler.join()  # don't write the samples while the last one is still being added
+        path = profiler.write(time.strftime(args.profile))
+        logger.info('Profile (%d samples, %.1f%% overhead) written to %s',
+                    profiler.sample_count, profiler.overhead * 100, path)
     sys.exit(0)
 
 
 class WaistAlignThread(threading.Thread):
     def __init__(self):
-        threading.Thread.__init__(self)
+        threading.Thread.__init__(self, name='WaistAlignThread')
 
     def run(self):
         logger.info("WaistAlignThread running!")
@@ -281,9 +503,138 @@ class WaistAlignThread(threading.Thread):
         logger.info("WaistAlignThread stopping!")
 
 
+# Forward kinematics collision check against the base and the work surface. Joint angles follow
+# robot-arm.py: shoulder forward, elbow up and pitch down are negative motor positions.
+if args.collision_check:
+    logger.info("Building collision grid...")
+    collision_checker = CollisionChecker(build_grid(), ArmGeometry(), lookahead=COLLISION_LOOKAHEAD)
+else:
+    collision_checker = None
+
+
+def joint_angles(waist_position, shoulder_position, elbow_position, pitch_position):
+    """ motor positions to the joint angles the collision checker works with """
+    return (waist_position / WAIST_RATIO,
+            -shoulder_position / SHOULDER_RATIO,
+            -elbow_position / ELBOW_RATIO,
+            pitch_position / PITCH_RATIO)
+
+
+def collision_scale(waist_target, shoulder_target, elbow_target, pitch_target, pitch_position):
+    """ factor to scale the arm's joint speeds by so it doesn't run into the base or table """
+    if not (waist_target or shoulder_target or elbow_target or pitch_target):
+        return 1.0
+    angles = joint_angles(waist_motor.position, shoulder_motors.left_motor.position, elbow_motor.position,
+                          pitch_position)
+    velocities = (waist_target * LARGE_MOTOR_MAX_DPS / 100 / WAIST_RATIO,
+                  -shoulder_target * LARGE_MOTOR_MAX_DPS / 100 / SHOULDER_RATIO,
+                  -elbow_target * LARGE_MOTOR_MAX_DPS / 100 / ELBOW_RATIO,
+                  pitch_target * MEDIUM_MOTOR_MAX_DPS / 100 / PITCH_RATIO)
+    return collision_checker.scale(angles, velocities)
+
+
+# Setpoint filters between input and motors, one per joint
+shoulder_filter = SetpointFilter(CONTROL_RATE, max_accel=MAX_ACCEL, max_jerk=MAX_JERK, quantum=SPEED_QUANTUM)
+elbow_filter = SetpointFilter(CONTROL_RATE, max_accel=MAX_ACCEL, max_jerk=MAX_JERK, quantum=SPEED_QUANTUM)
+waist_filter = SetpointFilter(CONTROL_RATE, max_accel=MAX_ACCEL, max_jerk=MAX_JERK, quantum=SPEED_QUANTUM)
+roll_filter = SetpointFilter(CONTROL_RATE, max_accel=MAX_ACCEL, max_jerk=MAX_JERK, quantum=SPEED_QUANTUM)
+pitch_filter = SetpointFilter(CONTROL_RATE, max_accel=MAX_ACCEL, max_jerk=MAX_JERK, quantum=SPEED_QUANTUM)
+spin_filter = SetpointFilter(CONTROL_RATE, max_accel=MAX_ACCEL, max_jerk=MAX_JERK, quantum=SPEED_QUANTUM)
+grabber_filter = SetpointFilter(CONTROL_RATE, max_accel=MAX_ACCEL, max_jerk=MAX_JERK, quantum=SPEED_QUANTUM)
+
+
+# Stall monitor: cuts jammed motors (e.g. spin and grabber fighting over the worm gear, or a joint
+# driven into a hard stop). Local motors are read directly, remote ones come batched in telemetry.
+stall_motors = {
+    'waist': (waist_motor,),
+    'shoulder': (shoulder_motors.left_motor, shoulder_motors.right_motor),
+    'elbow': (elbow_motor,),
+    'roll': (roll_motor,),
+    'pitch': (pitch_motor,),
+    'spin': (spin_motor,),
+    'grabber': (grabber_motor,) if grabber_motor else (),
+}
+last_stall_frame = [None]
+
+
+def stall_sample():
+    """ whether each joint is stalled/overloaded and running, and its speed and duty cycle """
+    samples = {}
+    for name in ('waist', 'shoulder', 'elbow'):
+        jammed = False
+        running = False
+        speed = None
+        duty_cycle = 0
+        for motor in stall_motors[name]:
+            state = motor.state
+            jammed = jammed or 'stalled' in state or 'overloaded' in state
+            running = running or ('running' in state and 'holding' not in state)
+            motor_speed = motor.speed
+            speed = motor_speed if speed is None or abs(motor_speed) < abs(speed) else speed
+            motor_duty_cycle = motor.duty_cycle
+            duty_cycle = motor_duty_cycle if abs(motor_duty_cycle) > abs(duty_cycle) else duty_cycle
+        samples[name] = (jammed, running, speed, duty_cycle)
+
+    # Only use each telemetry frame once, or a slow sender would make jams count double
+    frame = None if telemetry.stale else telemetry.frame
+    if frame is not None and frame is not last_stall_frame[0]:
+        last_stall_frame[0] = frame
+        for name in MOTOR_NAMES:
+            motor = frame.motors[name]
+            if motor.flags & PRESENT:
+                running = bool(motor.flags & RUNNING) and not motor.flags & HOLDING
+                samples[name] = (bool(motor.flags & (STALLED | OVERLOADED)), running, motor.speed,
+                                 motor.duty_cycle)
+    return samples
+
+
+def stall_stop(name):
+    for motor in stall_motors[name]:
+        motor.stop()
+    if name == 'spin' and grabber_motor:
+        # the grabber follows the spin motor to keep the worm gear steady
+        grabber_motor.stop()
+
+
+stall_monitor = StallMonitor(stall_sample, stall_stop, rate=STALL_MONITOR_RATE, stall_samples=STALL_SAMPLES,
+                             min_duty=STALL_MIN_DUTY, min_speed=STALL_MIN_SPEED, backoff_time=STALL_BACKOFF,
+                             budget=STALL_MONITOR_BUDGET)
+
+
+def backed_off(name, joint_filter, target):
+    """ zero the target of a joint the stall monitor cut, as long as it would drive it back into the jam """
+    if stall_monitor.blocked(name, target):
+        # the monitor already stopped the motor, don't ramp it down from the old speed
+        joint_filter.reset()
+        return 0
+    return target
+
+
+def halt(motor, joint_filter):
+    """ stop a joint at once instead of ramping it down, and start ramping from standstill """
+    if joint_filter.output:
+        motor.stop()
+    joint_filter.reset()
+
+
+def drive(motor, joint_filter, target):
+    """ ramp a single motor towards the target speed, only sending a command when the speed changes """
+    speed = joint_filter.update(target)
+    if joint_filter.changed:
+        if speed:
+            motor.on(speed)
+        else:
+            motor.stop()
+
+
 class MotorThread(threading.Thread):
     def __init__(self):
-        threading.Thread.__init__(self)
+        threading.Thread.__init__(self, name='MotorThread')
+        # control loop timing, in seconds
+        self.tick_time = 0
+        self.max_tick_time = 0
+        self.late_ticks = 0
+        self.last_tick = None
 
     def run(self):
         logger.info("MotorThread running!")
@@ -299,49 +650,121 @@ class MotorThread(threading.Thread):
         remote_leds.set_color("RIGHT", "GREEN")
 
         logger.info("Starting main loop...")
+        tick = 1.0 / CONTROL_RATE
+        tick_count = 0
+        pitch_position = 0
+        next_tick = time.time()
         while running:
-            # Proportional control
-            if shoulder_speed != 0:
-                shoulder_motors.on(shoulder_speed, shoulder_speed)
-            elif shoulder_motors.is_running:
-                shoulder_motors.stop()
-            
-            # Proportional control
-            if elbow_speed != 0:
-                elbow_motor.on(elbow_speed)
-            elif elbow_motor.is_running:
-                elbow_motor.stop()
+            tick_start = time.time()
 
             # on/off control
-            if not aligning_waist:
-                if waist_left:
-                    waist_motor.on(calculate_speed(-SLOW_SPEED))
-                elif waist_right:
-                    waist_motor.on(calculate_speed(SLOW_SPEED))
-                elif waist_motor.is_running:
-                    waist_motor.stop()
+            if waist_left:
+                waist_target = calculate_speed(-SLOW_SPEED)
+            elif waist_right:
+                waist_target = calculate_speed(SLOW_SPEED)
+            else:
+                waist_target = 0
 
             # on/off control
             if roll_left:
-                roll_motor.on(calculate_speed(-SLOW_SPEED))
+                roll_target = calculate_speed(-SLOW_SPEED)
             elif roll_right:
-                roll_motor.on(calculate_speed(SLOW_SPEED))
-            elif roll_motor.is_running:
-                roll_motor.stop()
+                roll_target = calculate_speed(SLOW_SPEED)
+            elif tilt_input:
+                # proportional control, tilt_input speeds are -1 to 1
+                roll_target = tilt_input.roll_speed * calculate_speed(SLOW_SPEED)
+            else:
+                roll_target = 0
 
             # on/off control
             #
             # Pitch affects grabber as well, but to a lesser degree. We could improve this 
             # in the future to adjust grabber based on pitch movement as well.
             if pitch_up:
-                pitch_motor.on(calculate_speed(VERY_SLOW_SPEED))
+                pitch_target = calculate_speed(VERY_SLOW_SPEED)
             elif pitch_down:
-                pitch_motor.on(calculate_speed(-VERY_SLOW_SPEED))
-            elif pitch_motor.is_running:
-                pitch_motor.stop()
+                pitch_target = calculate_speed(-VERY_SLOW_SPEED)
+            elif tilt_input:
+                # proportional control, tilt_input speeds are -1 to 1
+                pitch_target = tilt_input.pitch_speed * calculate_speed(VERY_SLOW_SPEED)
+            else:
+                pitch_target = 0
+
+            # on/off control
+            if spin_left:
+                spin_target = calculate_speed(-SLOW_SPEED)
+            elif spin_right:
+                spin_target = calculate_speed(SLOW_SPEED)
+            else:
+                spin_target = 0
 
             # on/off control
+            if grabber_open:
+                grabber_target = calculate_speed(NORMAL_SPEED)
+            elif grabber_close:
+                grabber_target = calculate_speed(-NORMAL_SPEED)
+            else:
+                grabber_target = 0
+
+            # Scale down arm motions that would collide within the lookahead
+            shoulder_target = shoulder_speed
+            elbow_target = elbow_speed
+            if collision_checker:
+                pitch_state = telemetry.motor('pitch')
+                if pitch_state:
+                    pitch_position = pitch_state.position
+                elif tick_count % PITCH_POSITION_INTERVAL == 0:
+                    # no recent telemetry, fall back to reading it over RPyC
+                    pitch_position = pitch_motor.position
+                scale = collision_scale(waist_target, shoulder_target, elbow_target, pitch_target, pitch_position)
+                if scale == 0:
+                    # A veto: ramping down takes longer than the lookahead, so stop right here
+                    flight_recorder.record('Collision check stopped the arm')
+                    halt(waist_motor, waist_filter)
+                    halt(shoulder_motors, shoulder_filter)
+                    halt(elbow_motor, elbow_filter)
+                    halt(pitch_motor, pitch_filter)
+                    waist_target = shoulder_target = elbow_target = pitch_target = 0
+                elif scale < 1:
+                    flight_recorder.record('Collision check scaled speeds by %s', scale)
+                    waist_target *= scale
+                    shoulder_target *= scale
+                    elbow_target *= scale
+                    pitch_target *= scale
+            tick_count += 1
+
+            # Hold off joints that jammed
+            shoulder_target = backed_off('shoulder', shoulder_filter, shoulder_target)
+            elbow_target = backed_off('elbow', elbow_filter, elbow_target)
+            waist_target = backed_off('waist', waist_filter, waist_target)
+            roll_target = backed_off('roll', roll_filter, roll_target)
+            pitch_target = backed_off('pitch', pitch_filter, pitch_target)
+            spin_target = backed_off('spin', spin_filter, spin_target)
+            grabber_target = backed_off('grabber', grabber_filter, grabber_target)
+
+            # Ramp all joints towards their targets and only send a command when the filtered speed
+            # actually changes.
             #
+            # Proportional control
+            speed = shoulder_filter.update(shoulder_target)
+            if shoulder_filter.changed:
+                if speed:
+                    shoulder_motors.on(speed, speed)
+                else:
+                    shoulder_motors.stop()
+
+            # Proportional control
+            drive(elbow_motor, elbow_filter, elbow_target)
+
+            if aligning_waist:
+                # align_waist_to_color() is driving the waist, it stops it when done
+                waist_filter.reset()
+            else:
+                drive(waist_motor, waist_filter, waist_target)
+
+            drive(roll_motor, roll_filter, roll_target)
+            drive(pitch_motor, pitch_filter, pitch_target)
+
             # If we keep spinning, the grabber motor can get stuck because it remains stationary
             # but is forced to move around the worm gear. We need to adjust it while spinning.
             # 
@@ -356,44 +779,311 @@ class MotorThread(threading.Thread):
             # think when using regular gears the 7 ratio should be sufficient.
             # NOTE: Yes, with regular gears the calculated ratio is correct!
             GRABBER_SPIN_RATIO = 7
-            if spin_left:
-                spin_motor_speed = calculate_speed(-SLOW_SPEED)
-                spin_motor.on(spin_motor_speed)
-                if grabber_motor:
-                    # determine grabber_motor speed based on spin_motor speed & invert
-                    grabber_spin_sync_speed = (spin_motor_speed / GRABBER_SPIN_RATIO) * -1
-                    grabber_motor.on(grabber_spin_sync_speed, False)
-                    # logger.info('Spin motor {}, grabber {}'.format(spin_motor_speed, grabber_spin_sync_speed))
-            elif spin_right:
-                spin_motor_speed = calculate_speed(SLOW_SPEED)
-                spin_motor.on(spin_motor_speed)
-                if grabber_motor:
-                    # determine grabber_motor speed based on spin_motor speed & invert
-                    grabber_spin_sync_speed = (spin_motor_speed / GRABBER_SPIN_RATIO) * -1
-                    grabber_motor.on(grabber_spin_sync_speed, False)
-                    # logger.info('Spin motor {}, grabber {}'.format(spin_motor_speed, grabber_spin_sync_speed))
-            elif spin_motor.is_running:
-                spin_motor.stop()
-                if grabber_motor:
-                    grabber_motor.stop()
-
-            # on/off control - can only control this directly if we're not currently spinning
-            elif grabber_motor:
-                if grabber_open:
-                    grabber_motor.on(calculate_speed(NORMAL_SPEED), False)
-                elif grabber_close:
-                    grabber_motor.on(calculate_speed(-NORMAL_SPEED), False)
-                elif grabber_motor.is_running:
-                    grabber_motor.stop()
-        
+            spin_motor_speed = spin_filter.update(spin_target)
+            if spin_filter.changed:
+                if spin_motor_speed:
+                    spin_motor.on(spin_motor_speed)
+                    if grabber_motor:
+                        # determine grabber_motor speed based on spin_motor speed & invert
+                        grabber_spin_sync_speed = (spin_motor_speed / GRABBER_SPIN_RATIO) * -1
+                        grabber_motor.on(grabber_spin_sync_speed, False)
+                        flight_recorder.record('Spin motor %s, grabber %s', spin_motor_speed, grabber_spin_sync_speed)
+                else:
+                    spin_motor.stop()
+                    if grabber_motor:
+                        grabber_motor.stop()
+                grabber_filter.reset()
+
+            # can only control the grabber directly if we're not currently spinning
+            elif grabber_motor and not spin_motor_speed:
+                speed = grabber_filter.update(grabber_target)
+                if grabber_filter.changed:
+                    if speed:
+                        grabber_motor.on(speed, False)
+                    else:
+                        grabber_motor.stop()
+
+            # Run at a fixed rate, the setpoint filters are tuned for it
+            now = time.time()
+            self.tick_time = now - tick_start
+            self.last_tick = now
+            self.max_tick_time = max(self.max_tick_time, self.tick_time)
+            next_tick += tick
+            delay = next_tick - now
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # we're running late, don't try to catch up
+                self.late_ticks += 1
+                next_tick = time.time()
+
         logger.info("MotorThread stopping!")
 
 
+def dashboard_snapshot():
+    """ everything the dashboard shows, without any RPyC calls: remote state comes from telemetry """
+    state = {
+        'waist.position': waist_motor.position,
+        'waist.speed': waist_motor.speed,
+        'shoulder.position': shoulder_motors.left_motor.position,
+        'shoulder.speed': shoulder_motors.left_motor.speed,
+        'elbow.position': elbow_motor.position,
+        'elbow.speed': elbow_motor.speed,
+        'battery.local.volts': round(power.measured_volts, 2),
+        'battery.local.amps': round(power.measured_amps, 2),
+        'loop.tick_ms': round(motor_thread.tick_time * 1000),
+        'loop.max_tick_ms': round(motor_thread.max_tick_time * 1000),
+        'loop.late_ticks': motor_thread.late_ticks,
+        'telemetry.stale': telemetry.stale,
+        'stall.events': len(stall_monitor.events),
+        'stall.reaction_ms': round(stall_monitor.reaction_time * 1000),
+    }
+
+    frame = None if telemetry.stale else telemetry.frame
+    for name in MOTOR_NAMES:
+        motor = frame.motors[name] if frame else None
+        state[name + '.position'] = motor.position if motor else None
+        state[name + '.speed'] = motor.speed if motor else None
+        state[name + '.running'] = bool(motor.flags & RUNNING) if motor else None
+        state[name + '.stalled'] = bool(motor.flags & STALLED) if motor else None
+    state['battery.remote.volts'] = round(frame.volts, 2) if frame else None
+    state['battery.remote.amps'] = round(frame.amps, 2) if frame else None
+
+    if color_sensor:
+        state['sensor.color'] = color_sensor.color_name
+    if shoulder_touch:
+        state['sensor.shoulder_touch'] = shoulder_touch.is_pressed
+    if elbow_touch:
+        state['sensor.elbow_touch'] = elbow_touch.is_pressed
+    return state
+
+
+def health_status():
+    """ heartbeat for the supervisor, None while the control loop isn't ticking (or, before it
+    starts, the pick and place isn't polling its moves) """
+    last_alive = motor_thread.last_tick if motor_thread else last_pick_place_poll[0]
+    if last_alive is None or time.time() - last_alive > HEARTBEAT_MAX_TICK_AGE:
+        return None
+    status = {
+        'telemetry_stale': telemetry.stale,
+        'stalls': len(stall_monitor.events),
+        'volts': round(power.measured_volts, 2),
+    }
+    if motor_thread:
+        status['max_tick_ms'] = round(motor_thread.max_tick_time * 1000)
+        status['late_ticks'] = motor_thread.late_ticks
+    else:
+        status['pick_place'] = True
+    return status
+
+
+# Optional sampling profiler, attributing time to subsystems by thread (or RPyC frames for remote I/O)
+if args.profile:
+    profiler = SamplingProfiler(
+        interval=PROFILE_INTERVAL,
+        thread_tags={
+            'MainThread': 'input',
+            'MotorThread': 'control tick',
+            'WaistAlignThread': 'sensors',
+            'TiltInput': 'input',
+            'TelemetryMirror': 'remote I/O',
+            'LeaseRenewer': 'remote I/O',
+            'Dashboard': 'dashboard',
+            'StallMonitor': 'sensors',
+            'Heartbeat': 'health',
+        },
+        frame_tags=[('rpyc', 'remote I/O')])
+    profiler.start()
+    logger.info('Profiling to %s', args.profile)
+else:
+    profiler = None
+
+def local_joint(name, *motors):
+    """ a scheduler joint for motors on this brick, moving all of them together """
+    def start(position, speed):
+        for motor in motors:
+            motor.on_to_position(speed, position, True, False)
+
+    def state():
+        return motors[0].position, any(motor.is_running for motor in motors)
+
+    def stop():
+        for motor in motors:
+            motor.stop()
+
+    return Joint(name, 'primary', start, state, stop)
+
+
+def remote_joint(name, motor):
+    """ a scheduler joint for a motor on the secondary brick, polled through telemetry """
+    def start(position, speed):
+        motor.on_to_position(speed, position, True, False)
+
+    def state():
+        motor_state = telemetry.motor(name)
+        if motor_state is None:
+            # no recent telemetry, ask over RPyC
+            return motor.position, motor.is_running
+        return motor_state.position, bool(motor_state.flags & RUNNING)
+
+    def stalled():
+        motor_state = telemetry.motor(name)
+        if motor_state is None:
+            return 'stalled' in motor.state
+        return bool(motor_state.flags & STALLED)
+
+    return Joint(name, 'secondary', start, state, motor.stop, stalled=stalled)
+
+
+def pick_and_place_tasks(cycles):
+    """ tasks moving an object back and forth between both sides of the arm, based on the Reach
+    routine in robot-arm.py """
+    tasks = []
+    retract = None
+    for cycle in range(cycles):
+        for name, waist_angle in (('pick', PICK_WAIST_ANGLE), ('place', PLACE_WAIST_ANGLE)):
+            pick = name == 'pick'
+            # Only turn once the previous task has pulled the arm back
+            turn = Move('waist', waist_angle * WAIST_RATIO, FAST_SPEED, after=[retract] if retract else [])
+            # Elbow, pitch and grabber don't need to wait for that
+            elbow = Move('elbow', REACH_ELBOW_ANGLE * ELBOW_RATIO, NORMAL_SPEED)
+            pitch = Move('pitch', REACH_PITCH_ANGLE * PITCH_RATIO, SLOW_SPEED)
+            moves = [turn, elbow, pitch]
+            if pick and grabber_motor:
+                moves.append(Move('grabber', 0, NORMAL_SPEED))  # open
+            reach = Move('shoulder', REACH_SHOULDER_ANGLE * SHOULDER_RATIO, NORMAL_SPEED, after=list(moves))
+            moves.append(reach)
+            if grabber_motor:
+                # Closing stalls on the object before reaching the closed angle, that's the grip
+                moves.append(Move('grabber', GRABBER_CLOSED_ANGLE * GRABBER_RATIO if pick else 0, NORMAL_SPEED,
+                                  after=[reach], grip=pick))
+            retract = Move('shoulder', 0, NORMAL_SPEED, after=[moves[-1]])
+            moves.append(retract)
+            tasks.append(Task('{} {}'.format(name, cycle + 1), moves))
+
+    # Back to where we started
+    home = [Move('waist', 0, FAST_SPEED, after=[retract]), Move('elbow', 0, SLOW_SPEED, after=[retract]),
+            Move('pitch', 0, SLOW_SPEED, after=[retract])]
+    tasks.append(Task('home', home))
+    return tasks
+
+
+def colliding_move(tasks):
+    """ the first planned move that takes the arm into the base or the table, if any
+
+    Moves that can run at the same time (the same number of moves deep in the scheduler's
+    dependencies) are swept together, interpolating all their joints at once from where the previous
+    moves left them, like the arm moves when they overlap.
+    """
+    dependencies = MotionScheduler([]).dependencies(tasks)
+    levels = {}
+    batches = {}
+    for task in tasks:
+        for move in task.moves:
+            level = 1 + max([levels[before] for before in dependencies[move]] or [0])
+            levels[move] = level
+            if move.joint != 'grabber':  # the grabber doesn't change the arm's reach
+                batches.setdefault(level, []).append((task, move))
+
+    pose = {'waist': waist_motor.position, 'shoulder': shoulder_motors.left_motor.position,
+            'elbow': elbow_motor.position, 'pitch': pitch_motor.position}
+    for level in sorted(batches):
+        start = dict(pose)
+        for step in range(1, PICK_PLACE_CHECK_STEPS + 1):
+            for _, move in batches[level]:
+                joint_start = start[move.joint]
+                pose[move.joint] = joint_start + (move.position - joint_start) * step / float(PICK_PLACE_CHECK_STEPS)
+            angles = joint_angles(pose['waist'], pose['shoulder'], pose['elbow'], pose['pitch'])
+            if collision_checker.collisions(*angles):
+                return batches[level][0]
+    return None
+
+
+last_pick_place_poll = [None]
+
+
+def run_pick_and_place(cycles):
+    tasks = pick_and_place_tasks(cycles)
+    if collision_checker:
+        collision = colliding_move(tasks)
+        if collision:
+            task, move = collision
+            logger.error('Skipping pick and place: %s in task %s would collide', move, task.name)
+            return
+
+    joints = [local_joint('waist', waist_motor),
+              local_joint('shoulder', shoulder_motors.left_motor, shoulder_motors.right_motor),
+              local_joint('elbow', elbow_motor),
+              remote_joint('pitch', pitch_motor)]
+    if grabber_motor:
+        joints.append(remote_joint('grabber', grabber_motor))
+
+    # Stop as soon as the stall monitor cuts a joint, rather than waiting for the move to time out.
+    # Except the grabber: it stalls on every grip, and a jam opening it still times out.
+    stall_count = len(stall_monitor.events)
+
+    def stalled():
+        # called on every poll, which keeps the heartbeat going until the motor thread takes over
+        last_pick_place_poll[0] = time.time()
+        for _, name, _, _ in stall_monitor.events[stall_count:]:
+            if name != 'grabber':
+                return '{} jammed'.format(name)
+        return None
+
+    # on_to_position() sets the hold stop action, put back the ones set up for gamepad control
+    # (e.g. the grabber has to coast to follow the spin motor through the worm gear)
+    motors = [waist_motor, shoulder_motors.left_motor, shoulder_motors.right_motor, elbow_motor, pitch_motor]
+    if grabber_motor:
+        motors.append(grabber_motor)
+    stop_actions = [motor.stop_action for motor in motors]
+
+    start = time.time()
+    try:
+        MotionScheduler(joints, abort_check=stalled).run(tasks)
+    except MotionAborted as e:
+        logger.error('Pick and place aborted: %s', e)
+        return
+    finally:
+        for motor, stop_action in zip(motors, stop_actions):
+            motor.stop_action = stop_action
+    total = time.time() - start
+    logger.info('%d tasks in %.2fs, %.2fs of task time overlapped', len(tasks), total,
+                sum(task.cycle_time for task in tasks) - total)
+
+
+# Live dashboard, only started once the motor thread it reports on is running
+if args.dashboard:
+    dashboard = Dashboard(dashboard_snapshot, port=args.dashboard, max_rate=DASHBOARD_RATE)
+else:
+    dashboard = None
+
+# Heartbeat to the supervisor running several arms
+if args.health:
+    heartbeat = Heartbeat(parse_address(args.health), args.name, health_status, interval=HEARTBEAT_INTERVAL)
+else:
+    heartbeat = None
+
+# Started once the scripted pick and place is done
+motor_thread = None
+
 # Ensure clean shutdown on CTRL+C
 signal(SIGINT, clean_shutdown)
 
 log_power_info()
 
+# Stall and overload detection, also covering the scripted pick and place
+stall_monitor.start()
+logger.info('Stall monitor running, reaction time %dms', stall_monitor.reaction_time * 1000)
+
+# Sends while the pick and place polls its moves, then while the motor thread keeps ticking
+if heartbeat:
+    heartbeat.start()
+
+# Scripted pick and place before the gamepad takes over
+if args.pick_place:
+    logger.info('Running %d pick and place cycles...', args.pick_place)
+    run_pick_and_place(args.pick_place)
+
 # Main motor control thread
 motor_thread = MotorThread()
 motor_thread.setDaemon(True)
@@ -405,8 +1095,19 @@ if color_sensor:
     waist_align_thread.setDaemon(True)
     waist_align_thread.start()
 
+# Live dashboard, streaming changes only
+if dashboard:
+    dashboard.start()
+    logger.info('Dashboard running on port %d', dashboard.port)
+
+# Batched reading of the motion sensors for tilt control
+if tilt_input:
+    tilt_input.start()
+
 # Handle gamepad input
 for event in gamepad.read_loop():  # this loops infinitely
+    flight_recorder.record('Gamepad event %s %s %s', event.type, event.code, event.value)
+
     if event.type == 3:  # stick input
         if event.code == 0:  # Left stick X-axis
             shoulder_speed = scale_stick(event.value, deadzone=JOYSTICK_DEADZONE, invert=True)
@@ -495,9 +1196,9 @@ for event in gamepad.read_loop():  # this loops infinitely
          
         elif event.code == 315 and event.value == 1:  # Options
             # debug info
-            logger.info('Elbow motor state: {}'.format(elbow_motor.state))
-            logger.info('Elbow motor duty cycle: {}'.format(elbow_motor.duty_cycle))
-            logger.info('Elbow motor speed: {}'.format(elbow_motor.speed))
+            logger.info('Elbow motor state: %s', elbow_motor.state)
+            logger.info('Elbow motor duty cycle: %s', elbow_motor.duty_cycle)
+            logger.info('Elbow motor speed: %s', elbow_motor.speed)
 
         elif event.code == 316 and event.value == 1:  # PS
             # stop control loop
@@ -512,7 +1213,6 @@ for event in gamepad.read_loop():  # this loops infinitely
             remote_leds.set_color("LEFT", "BLACK")
             remote_leds.set_color("RIGHT", "BLACK")
 
-            time.sleep(1)  # Wait for the motor thread to finish
-            break
+            break  # clean_shutdown() waits for the motor thread to finish
 
 clean_shutdown()
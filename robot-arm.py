@@ -16,6 +16,8 @@ from ev3dev2.motor import OUTPUT_A, OUTPUT_B, OUTPUT_C, OUTPUT_D, SpeedPercent,
 
 import rpyc
 
+from flight_recorder import FlightRecorder, dump_on_exception, setup_logging
+
 # Create a RPyC connection to the remote ev3dev device.
 # Use the hostname or IP address of the ev3dev device.
 # If this fails, verify your IP connectivty via ``ping X.X.X.X``
@@ -24,8 +26,9 @@ conn = rpyc.classic.connect('1.1.1.1') #change this IP address for your slave EV
 remote_motor = conn.modules['ev3dev2.motor']
 remote_led = conn.modules['ev3dev2.led']
 
-logging.basicConfig(level=logging.INFO, stream=sys.stdout, format='%(message)s')
-logging.getLogger().addHandler(logging.StreamHandler(sys.stderr))
+flight_recorder = FlightRecorder()
+setup_logging(flight_recorder, level=logging.INFO, stream=sys.stdout, fmt='%(message)s')
+dump_on_exception(flight_recorder, 'flight-recorder-%Y%m%d-%H%M%S.log', 30)
 logger = logging.getLogger(__name__)
 
 ## Some helpers ##
@@ -246,6 +249,7 @@ motor_thread.setDaemon(True)
 motor_thread.start()
 
 for event in gamepad.read_loop():   #this loops infinitely
+    flight_recorder.record('Gamepad event %s %s %s', event.type, event.code, event.value)
     if event.type == 3:
         if event.code == 0: #Left stick X-axis
             forward_speed = scale_stick(event.value)
@@ -347,4 +351,5 @@ for event in gamepad.read_loop():   #this loops infinitely
         remote_leds.set_color("RIGHT", "BLACK")
 
         time.sleep(1) # Wait for the motor thread to finish
+        flight_recorder.dump(time.strftime('flight-recorder-%Y%m%d-%H%M%S.log'), 30)
         break 
@@ -0,0 +1,89 @@
+# Sampling profiler, kept free of ev3dev imports for easy unit testing
+import collections
+import sys
+import threading
+import time
+
+
+class SamplingProfiler(threading.Thread):
+    """ periodically sample the stacks of all threads and count them per subsystem
+
+    Every sample is attributed to a subsystem tag: `thread_tags` maps thread names to tags, and
+    `frame_tags` maps a substring of a source file name to a tag which wins when any frame of the
+    stack is in such a file (e.g. RPyC serialization inside the control tick counts as remote I/O).
+    Samples are kept as tuples of code objects, they're only turned into text by collapsed().
+    """
+
+    def __init__(self, interval=0.05, thread_tags=None, frame_tags=None, max_depth=64):
+        threading.Thread.__init__(self, name='SamplingProfiler')
+        self.daemon = True
+        self.interval = interval
+        self.thread_tags = thread_tags or {}
+        self.frame_tags = frame_tags or []
+        self.max_depth = max_depth
+        self.samples = collections.Counter()
+        self.sample_count = 0
+        self.sample_time = 0.0
+        self._thread_names = {}
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _thread_name(self, ident):
+        name = self._thread_names.get(ident)
+        if name is None:
+            # Only enumerate threads when we see one we don't know yet
+            self._thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            name = self._thread_names.get(ident, str(ident))
+        return name
+
+    def _tag(self, thread_name, codes):
+        for code in codes:
+            for pattern, tag in self.frame_tags:
+                if pattern in code.co_filename:
+                    return tag
+        return self.thread_tags.get(thread_name, 'other')
+
+    def sample(self):
+        start = time.time()
+        own_ident = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            codes = []
+            while frame is not None and len(codes) < self.max_depth:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            codes.reverse()
+            thread_name = self._thread_name(ident)
+            self.samples[(self._tag(thread_name, codes), thread_name, tuple(codes))] += 1
+        self.sample_count += 1
+        self.sample_time += time.time() - start
+
+    @property
+    def overhead(self):
+        """ fraction of wall time spent sampling """
+        if not self.sample_count:
+            return 0.0
+        return (self.sample_time / self.sample_count) / self.interval
+
+    def collapsed(self):
+        """ return the samples in the collapsed stack format used by flamegraph.pl and speedscope """
+        lines = []
+        for (tag, thread_name, codes), count in sorted(self.samples.items(), key=lambda item: -item[1]):
+            frames = [tag, thread_name]
+            frames.extend('{} ({}:{})'.format(code.co_name, code.co_filename, code.co_firstlineno)
+                          for code in codes)
+            lines.append('{} {}'.format(';'.join(frame.replace(';', ':') for frame in frames), count))
+        return lines
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            for line in self.collapsed():
+                f.write(line + '\n')
+        return path
@@ -0,0 +1,62 @@
+# Setpoint filtering in separate file for easy unit testing
+import math
+
+
+class SetpointFilter(object):
+    """ rate and jerk limited speed setpoint for a single joint, with quantized output
+
+    Instead of jumping straight to the requested speed, the output ramps towards it with at most
+    `max_accel` (speed units per second) acceleration, and the acceleration itself changes by at most
+    `max_jerk` (speed units per second squared). The output is rounded to multiples of `quantum` so
+    small stick jitter doesn't turn into a stream of slightly different motor commands; `changed`
+    tells whether the output differs from the previous tick and needs to be sent to the motor.
+
+    All limits are converted to per-tick steps once, for the given control loop `rate` in Hz.
+    """
+
+    def __init__(self, rate, max_accel=200, max_jerk=2000, quantum=2):
+        self.rate = rate
+        self.quantum = quantum
+        # Per-tick limits: max change of speed per tick, and of that change per tick
+        self.max_step = float(max_accel) / rate
+        self.max_step_change = float(max_jerk) / (rate * rate)
+        self.reset()
+
+    def reset(self, speed=0):
+        """ jump to `speed` without ramping, e.g. after something else has driven the motor """
+        self.speed = float(speed)
+        self.step = 0.0
+        self.output = self.quantize(speed)
+        self.changed = False
+
+    def quantize(self, speed):
+        return int(round(speed / self.quantum)) * self.quantum
+
+    def update(self, target):
+        """ advance one control tick towards `target` and return the speed to command """
+        error = target - self.speed
+
+        # Largest step that still lets us ease the step back to zero before overshooting the
+        # target: stepping down from s by j per tick covers about s^2 / (2 * j) + s / 2.
+        j = self.max_step_change
+        limit = min(self.max_step, math.sqrt(j * j / 4 + 2 * j * abs(error)) - j / 2)
+        desired_step = math.copysign(limit, error)
+
+        # Jerk limit: the step changes gradually
+        if desired_step > self.step + self.max_step_change:
+            self.step += self.max_step_change
+        elif desired_step < self.step - self.max_step_change:
+            self.step -= self.max_step_change
+        else:
+            self.step = desired_step
+
+        self.speed += self.step
+        if (target - self.speed) * error <= 0:
+            # reached or crossed the target
+            self.speed = float(target)
+            self.step = 0.0
+
+        output = self.quantize(self.speed)
+        self.changed = output != self.output
+        self.output = output
+        return output
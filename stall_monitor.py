@@ -0,0 +1,100 @@
+# Stall and overload detection, kept free of ev3dev imports for easy unit testing
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class StallMonitor(threading.Thread):
+    """ watch every joint for stalls and overloads and back off the ones that jam
+
+    `sample()` returns a dict of joint name to (jammed, running, speed, duty_cycle), where `jammed`
+    is True when the driver reports the motor as stalled or overloaded and `running` when it's being
+    driven rather than holding or stopped. Joints that can't be sampled right now (e.g. stale
+    telemetry) are left out. A running joint also counts as jammed when it's driven with at least
+    `min_duty` percent duty cycle but turns slower than `min_speed` degrees per second; a holding one
+    needs that duty cycle to stay put under load.
+
+    After `stall_samples` jammed samples in a row, `on_stall(name)` is called to cut the motor and
+    the joint is blocked in the direction it was driven for `backoff_time` seconds; driving it the
+    other way, out of the jam, stays possible. To keep to the CPU `budget` (fraction of time spent
+    sampling), the sample period is stretched when sampling turns out to be slower than expected,
+    which also lengthens `reaction_time`.
+    """
+
+    def __init__(self, sample, on_stall, rate=10, stall_samples=3, min_duty=30, min_speed=20,
+                 backoff_time=1.0, budget=0.05, max_period=0.5):
+        threading.Thread.__init__(self, name='StallMonitor')
+        self.daemon = True
+        self.sample = sample
+        self.on_stall = on_stall
+        self.period = 1.0 / rate
+        self.min_period = self.period
+        self.max_period = max_period
+        self.stall_samples = stall_samples
+        self.min_duty = min_duty
+        self.min_speed = min_speed
+        self.backoff_time = backoff_time
+        self.budget = budget
+        self.counts = {}
+        self.backoff = {}  # joint name -> (until, direction)
+        self.events = []
+        self.running = True
+
+    @property
+    def reaction_time(self):
+        """ worst case seconds from a joint jamming to it being cut """
+        return self.stall_samples * self.period
+
+    def jammed(self, jammed, running, speed, duty_cycle):
+        return jammed or (running and abs(duty_cycle) >= self.min_duty and abs(speed) < self.min_speed)
+
+    def update(self, samples, now=None):
+        """ process one set of samples, returning the names of the joints that were cut """
+        if now is None:
+            now = time.time()
+        cut = []
+        for name, (jammed, running, speed, duty_cycle) in samples.items():
+            if not self.jammed(jammed, running, speed, duty_cycle):
+                self.counts[name] = 0
+                continue
+            count = self.counts.get(name, 0) + 1
+            self.counts[name] = count
+            if count == self.stall_samples:
+                direction = math.copysign(1, duty_cycle) if duty_cycle else 0
+                self.backoff[name] = (now + self.backoff_time, direction)
+                self.events.append((now, name, speed, duty_cycle))
+                logger.warning('%s jammed (speed %s, duty cycle %s%%), backing off', name, speed, duty_cycle)
+                try:
+                    self.on_stall(name)
+                except Exception as e:
+                    logger.error('Failed to stop %s: %s', name, e)
+                cut.append(name)
+        return cut
+
+    def blocked(self, name, speed, now=None):
+        """ whether driving the joint at `speed` would push it back into a jam it's backing off from """
+        backoff = self.backoff.get(name)
+        if backoff is None:
+            return False
+        until, direction = backoff
+        if (time.time() if now is None else now) >= until:
+            return False
+        return direction == 0 or speed * direction > 0
+
+    def run(self):
+        while self.running:
+            start = time.time()
+            try:
+                self.update(self.sample(), start)
+            except Exception as e:
+                logger.error('Stall monitor sample failed: %s', e)
+            cost = time.time() - start
+            # Stay within the budget, but speed back up when sampling gets cheaper again
+            self.period = min(self.max_period, max(self.min_period, cost / self.budget))
+            time.sleep(max(0.0, self.period - cost))
+
+    def stop(self):
+        self.running = False
@@ -0,0 +1,327 @@
+# Multi-arm supervisor, kept free of ev3dev imports for easy unit testing
+"""
+Run one remote_control.py process per arm, from a JSON config like:
+
+    {
+        "health_port": 5100,
+        "arms": [
+            {"name": "left", "remote_host": "10.42.0.3", "gamepad": "/dev/input/event2", "cpu": 0,
+             "args": ["--dashboard", "8081"]},
+            {"name": "right", "remote_host": "10.42.0.5", "gamepad": "/dev/input/event5", "cpu": 1,
+             "args": ["--dashboard", "8082"]}
+        ]
+    }
+
+Unless an arm's args set --telemetry-port, arms get consecutive telemetry ports starting at 5005.
+An arm that exits cleanly (e.g. stopped with the PS button) stays down, unless it sets
+"restart_on_exit": true; restarting it would re-run whatever it does on startup, unattended.
+
+Every arm is its own process with its own RPyC connection, so a hung brick only ever stalls its own
+arm. Arms send a UDP heartbeat to the supervisor, which restarts the ones that exit or go quiet.
+"""
+import argparse
+import json
+import logging
+import os
+import select
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+REMOTE_CONTROL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'remote_control.py')
+TELEMETRY_PORT = 5005  # remote_control.py's default, arms get consecutive ports from here
+
+
+class Arm(object):
+    """ one arm's control process, restarted with an increasing delay when it fails
+
+    `command` items may contain `{name}` and `{health}` (the supervisor's heartbeat address), which
+    are filled in on every start. `cpus` is the set of CPUs the process is pinned to. A process
+    exiting with status 0 is only restarted with `restart_on_exit`.
+    """
+
+    def __init__(self, name, command, cpus=None, restart_on_exit=False):
+        self.name = name
+        self.command = list(command)
+        self.cpus = set(cpus) if cpus is not None else None
+        self.restart_on_exit = restart_on_exit
+        self.process = None
+        self.started = None
+        self.stopping = None
+        self.next_start = 0
+        self.restart_delay = None
+        self.restarts = 0
+        self.last_heartbeat = None
+        self.status = None
+        self.state = 'stopped'
+
+    @property
+    def pid(self):
+        return self.process.pid if self.process else None
+
+    def start(self, health_address, now):
+        host, port = health_address
+        health = '{}:{}'.format(host, port)
+        command = [item.replace('{name}', self.name).replace('{health}', health) for item in self.command]
+        logger.info('Starting arm %s: %s', self.name, ' '.join(command))
+        self.process = subprocess.Popen(command)
+        if self.cpus:
+            set_affinity(self.process.pid, self.cpus)
+        self.started = now
+        self.stopping = None
+        self.last_heartbeat = None
+        self.status = None
+        self.state = 'starting'
+
+    def heartbeat(self, message, now):
+        if message.get('pid') != self.pid or self.stopping is not None:
+            return  # left over from a process we already gave up on
+        if self.state != 'ok':
+            logger.info('Arm %s is up', self.name)
+        self.last_heartbeat = now
+        self.status = message.get('status')
+        self.state = 'ok'
+
+    def stop(self, now):
+        """ ask the process to shut down cleanly; it gets killed if it doesn't in time """
+        if self.process is None or self.stopping is not None:
+            return
+        self.stopping = now
+        self.state = 'stopping'
+        try:
+            # remote_control.py stops all motors on SIGINT
+            self.process.send_signal(signal.SIGINT)
+        except OSError:
+            pass
+
+    def kill(self):
+        try:
+            self.process.kill()
+        except OSError:
+            pass
+        self.process.wait()
+
+
+def set_affinity(pid, cpus):
+    if not hasattr(os, 'sched_setaffinity'):
+        logger.warning('CPU affinity is not supported on this platform')
+        return False
+    try:
+        os.sched_setaffinity(pid, cpus)
+    except OSError as e:
+        logger.warning('Failed to pin %d to CPUs %s: %s', pid, sorted(cpus), e)
+        return False
+    return True
+
+
+class Supervisor(object):
+    """ keep a set of arms running and report on their health
+
+    A single thread runs everything: waiting for heartbeats with a timeout, polling the processes and
+    (re)starting them. It never talks to the bricks itself, so nothing an arm does can block it.
+    An arm that fails, doesn't send its first heartbeat within `startup_timeout` or then goes
+    `heartbeat_timeout` seconds without one is stopped (SIGINT, then SIGKILL after `stop_timeout`) and
+    restarted after `min_restart_delay`, doubling up to `max_restart_delay` while it keeps failing.
+    One that exits cleanly is left 'exited'.
+    """
+
+    def __init__(self, arms, health_port=0, bind_address='127.0.0.1', heartbeat_timeout=3, startup_timeout=60,
+                 stop_timeout=5, min_restart_delay=1, max_restart_delay=30, poll_interval=0.1):
+        self.arms = {arm.name: arm for arm in arms}
+        self.heartbeat_timeout = heartbeat_timeout
+        self.startup_timeout = startup_timeout
+        self.stop_timeout = stop_timeout
+        self.min_restart_delay = min_restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.poll_interval = poll_interval
+        self.running = True
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((bind_address, health_port))
+        self.health_address = self.sock.getsockname()
+
+    def receive(self, timeout):
+        """ handle all heartbeats arriving within `timeout` seconds """
+        deadline = time.time() + timeout
+        while True:
+            readable, _, _ = select.select([self.sock], [], [], max(0.0, deadline - time.time()))
+            if not readable:
+                return
+            data = self.sock.recv(65536)
+            try:
+                message = json.loads(data.decode('utf-8'))
+                arm = self.arms[message['name']]
+            except (ValueError, KeyError, TypeError):
+                continue  # not one of ours
+            arm.heartbeat(message, time.time())
+
+    def fail(self, arm, reason, now):
+        logger.warning('Arm %s %s, restarting', arm.name, reason)
+        if arm.state == 'ok':
+            arm.restart_delay = None  # it was healthy, so start over with a short delay
+        arm.stop(now)
+
+    def check(self, arm, now):
+        if arm.state == 'exited':
+            return
+        if arm.process is None:
+            if now >= arm.next_start:
+                if arm.started is not None:
+                    arm.restarts += 1
+                try:
+                    arm.start(self.health_address, now)
+                except OSError as e:
+                    logger.error('Failed to start arm %s: %s', arm.name, e)
+                    arm.started = now
+                    arm.restart_delay = self.max_restart_delay
+                    arm.next_start = now + arm.restart_delay
+                    arm.state = 'restarting'
+            return
+
+        if arm.process.poll() is not None:
+            if arm.stopping is None and arm.process.returncode == 0 and not arm.restart_on_exit:
+                logger.info('Arm %s exited, not restarting', arm.name)
+                arm.process = None
+                arm.state = 'exited'
+                return
+            if arm.stopping is None:
+                logger.warning('Arm %s exited with %s, restarting', arm.name, arm.process.returncode)
+                if arm.state == 'ok':
+                    arm.restart_delay = None
+            arm.restart_delay = min(self.max_restart_delay, arm.restart_delay * 2 if arm.restart_delay
+                                    else self.min_restart_delay)
+            arm.next_start = now + arm.restart_delay
+            arm.process = None
+            arm.state = 'restarting'
+        elif arm.stopping is not None:
+            if now - arm.stopping > self.stop_timeout:
+                logger.warning('Arm %s did not stop within %ss, killing it', arm.name, self.stop_timeout)
+                arm.kill()
+        elif arm.last_heartbeat is None:
+            if now - arm.started > self.startup_timeout:
+                self.fail(arm, 'sent no heartbeat within {}s'.format(self.startup_timeout), now)
+        elif now - arm.last_heartbeat > self.heartbeat_timeout:
+            self.fail(arm, 'is hung (no heartbeat for {:.1f}s)'.format(now - arm.last_heartbeat), now)
+
+    def step(self):
+        self.receive(self.poll_interval)
+        now = time.time()
+        for arm in self.arms.values():
+            self.check(arm, now)
+
+    def health(self):
+        """ per arm state, restart count, heartbeat age and last reported status """
+        now = time.time()
+        return {arm.name: {
+            'state': arm.state,
+            'pid': arm.pid,
+            'restarts': arm.restarts,
+            'heartbeat_age': round(now - arm.last_heartbeat, 2) if arm.last_heartbeat else None,
+            'status': arm.status,
+        } for arm in self.arms.values()}
+
+    def snapshot(self):
+        """ flat health for the dashboard """
+        state = {}
+        for name, health in self.health().items():
+            for key, value in health.items():
+                if key == 'status':
+                    for status_key, status_value in (value or {}).items():
+                        state['{}.{}'.format(name, status_key)] = status_value
+                else:
+                    state['{}.{}'.format(name, key)] = value
+        state['arms.ok'] = sum(arm.state == 'ok' for arm in self.arms.values())
+        state['arms.total'] = len(self.arms)
+        return state
+
+    def run(self):
+        while self.running:
+            self.step()
+        self.shutdown()
+
+    def shutdown(self):
+        """ stop all arms, killing the ones that don't stop in time """
+        now = time.time()
+        for arm in self.arms.values():
+            arm.stop(now)
+        deadline = now + self.stop_timeout
+        for arm in self.arms.values():
+            if arm.process is None:
+                continue
+            try:
+                arm.process.wait(max(0.0, deadline - time.time()))
+            except subprocess.TimeoutExpired:
+                logger.warning('Arm %s did not stop within %ss, killing it', arm.name, self.stop_timeout)
+                arm.kill()
+            arm.process = None
+            if arm.state != 'exited':
+                arm.state = 'stopped'
+        self.sock.close()
+
+    def stop(self):
+        self.running = False
+
+
+def load_config(path):
+    """ read the arms and supervisor options from a JSON config """
+    with open(path) as f:
+        config = json.load(f)
+    arms = []
+    telemetry_ports = {}
+    for index, arm in enumerate(config.pop('arms')):
+        command = arm.get('command')
+        if command is None:
+            command = [sys.executable, REMOTE_CONTROL, '--name', '{name}', '--health', '{health}']
+            if 'remote_host' in arm:
+                command += ['--remote-host', arm['remote_host']]
+            if 'gamepad' in arm:
+                command += ['--gamepad', arm['gamepad']]
+            args = arm.get('args', [])
+            if '--telemetry-port' in args:
+                port = int(args[args.index('--telemetry-port') + 1])
+            else:
+                port = TELEMETRY_PORT + index
+                command += ['--telemetry-port', str(port)]
+            # all arms run on this host, a second one on the same port could never start
+            if port in telemetry_ports:
+                raise ValueError('Arms {} and {} both use telemetry port {}'.format(
+                    telemetry_ports[port], arm['name'], port))
+            telemetry_ports[port] = arm['name']
+            command += args
+        cpus = arm.get('cpu')
+        if cpus is not None and not isinstance(cpus, list):
+            cpus = [cpus]
+        arms.append(Arm(arm['name'], command, cpus, arm.get('restart_on_exit', False)))
+    return arms, config
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run and watch one remote_control.py per robot arm')
+    parser.add_argument('config', help='JSON file listing the arms')
+    parser.add_argument('--dashboard', nargs='?', type=int, const=8080, metavar='PORT',
+                        help='serve the health of all arms on this port (default 8080)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s supervisor: %(message)s')
+    arms, options = load_config(args.config)
+    supervisor = Supervisor(arms, **options)
+    logger.info('Supervising %d arms, heartbeats on port %d', len(arms), supervisor.health_address[1])
+
+    dashboard = None
+    if args.dashboard:
+        from dashboard import Dashboard
+        dashboard = Dashboard(supervisor.snapshot, port=args.dashboard)
+        dashboard.start()
+
+    signal.signal(signal.SIGINT, lambda signal_received, frame: supervisor.stop())
+    signal.signal(signal.SIGTERM, lambda signal_received, frame: supervisor.stop())
+    supervisor.run()
+    if dashboard:
+        dashboard.stop()
+
+
+if __name__ == '__main__':
+    main()
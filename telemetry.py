@@ -0,0 +1,198 @@
+# State telemetry pushed from the secondary EV3, kept free of ev3dev/rpyc imports for easy unit testing
+import collections
+import socket
+import struct
+import threading
+import time
+
+# Motors on the secondary EV3, in frame order
+MOTOR_NAMES = ('roll', 'pitch', 'spin', 'grabber')
+
+# State flags, one bit per ev3dev motor state
+PRESENT = 1
+RUNNING = 2
+RAMPING = 4
+HOLDING = 8
+OVERLOADED = 16
+STALLED = 32
+
+# Frame: sender timestamp, sequence number, per motor position/speed/duty cycle/flags, battery volts/amps
+FRAME_FORMAT = '<dI' + 'ihbB' * len(MOTOR_NAMES) + 'ff'
+FRAME = struct.Struct(FRAME_FORMAT)
+
+MotorState = collections.namedtuple('MotorState', 'position speed duty_cycle flags')
+Frame = collections.namedtuple('Frame', 'timestamp sequence received motors volts amps')
+
+
+def renew_lease(lease, duration):
+    """ extend `lease` (a one item list holding a time.monotonic() deadline) to `duration` seconds from now
+
+    Self-contained so it can be teleported: the deadline has to come from the clock of the brick
+    that checks it.
+    """
+    import time
+
+    lease[0] = time.monotonic() + duration
+
+
+def push_state(motors, power, address, interval, frame_format, stop, lease=None):
+    """ send a state frame of the given motors and power supply to `address` every `interval` seconds
+
+    This function is self-contained on purpose: it is teleported to the secondary EV3 with
+    rpyc.classic.teleport_function() and runs there in a thread until `stop` is set or the `lease`
+    (see renew_lease()) runs out, so it doesn't outlive a primary that crashed or lost the
+    connection. Missing motors are passed as None.
+    """
+    import socket
+    import struct
+    import time
+
+    # Make local copies, iterating arguments that are still netrefs would be a round trip per frame
+    motors = tuple(motors)
+    address = (str(address[0]), int(address[1]))
+
+    flag_bits = {'running': 2, 'ramping': 4, 'holding': 8, 'overloaded': 16, 'stalled': 32}
+    frame = struct.Struct(frame_format)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sequence = 0
+    next_frame = time.time()
+    while not stop.is_set():
+        if lease is not None and time.monotonic() > lease[0]:
+            break  # the primary stopped renewing, it's gone
+        values = [time.time(), sequence]
+        for motor in motors:
+            if motor is None:
+                values.extend((0, 0, 0, 0))
+                continue
+            try:
+                flags = 1
+                for state in motor.state:
+                    flags |= flag_bits.get(state, 0)
+                values.extend((motor.position, motor.speed, motor.duty_cycle, flags))
+            except Exception:
+                values.extend((0, 0, 0, 0))
+        try:
+            values.extend((power.measured_volts, power.measured_amps))
+        except Exception:
+            values.extend((0.0, 0.0))
+
+        try:
+            sock.sendto(frame.pack(*values), address)
+        except Exception:
+            pass
+        sequence = (sequence + 1) & 0xffffffff
+
+        next_frame += interval
+        delay = next_frame - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            next_frame = time.time()
+    sock.close()
+
+
+def decode_frame(data, received=None):
+    values = FRAME.unpack(data)
+    motors = {}
+    for index, name in enumerate(MOTOR_NAMES):
+        offset = 2 + index * 4
+        motors[name] = MotorState(*values[offset:offset + 4])
+    return Frame(values[0], values[1], time.time() if received is None else received,
+                 motors, values[-2], values[-1])
+
+
+def local_address_for(remote_host):
+    """ the local IP address used to reach `remote_host` (connecting a UDP socket sends nothing) """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.connect((remote_host, 9))
+        return sock.getsockname()[0]
+    finally:
+        sock.close()
+
+
+class TelemetryMirror(threading.Thread):
+    """ receive state frames and keep the latest one as a local mirror of the secondary EV3
+
+    The receiving thread decodes each frame into an immutable Frame and swaps it in with a single
+    assignment, so reading the mirror from the control loop needs no lock and no network access.
+    """
+
+    def __init__(self, port, max_age=0.25, bind_address=''):
+        threading.Thread.__init__(self, name='TelemetryMirror')
+        self.daemon = True
+        self.max_age = max_age
+        self.frame = None
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((bind_address, port))
+        self.sock.settimeout(0.5)
+        self.port = self.sock.getsockname()[1]
+        self.running = True
+
+    def handle(self, data, received=None):
+        try:
+            frame = decode_frame(data, received)
+        except struct.error:
+            return
+        current = self.frame
+        # Drop frames that arrive out of order. A restarted sender counts from 0 again, but its
+        # frames have a newer timestamp.
+        if current is not None and frame.sequence < current.sequence and frame.timestamp <= current.timestamp:
+            return
+        self.frame = frame
+
+    def run(self):
+        while self.running:
+            try:
+                data = self.sock.recv(FRAME.size)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self.handle(data)
+
+    def stop(self):
+        self.running = False
+        self.sock.close()
+
+    @property
+    def age(self):
+        """ seconds since the latest frame was received, None if there isn't one """
+        frame = self.frame
+        return None if frame is None else time.time() - frame.received
+
+    @property
+    def stale(self):
+        frame = self.frame
+        return frame is None or time.time() - frame.received > self.max_age
+
+    def motor(self, name):
+        """ latest MotorState of the named motor, None when no (recent) frame is available """
+        frame = self.frame
+        if frame is None or time.time() - frame.received > self.max_age:
+            return None
+        return frame.motors[name]
+
+
+class LeaseRenewer(threading.Thread):
+    """ call `renew()` every `interval` seconds for as long as this process runs
+
+    Failures are ignored: when the connection is gone the lease simply runs out on the other side.
+    """
+
+    def __init__(self, renew, interval):
+        threading.Thread.__init__(self, name='LeaseRenewer')
+        self.daemon = True
+        self.renew = renew
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.renew()
+            except Exception:
+                pass
+
+    def stop(self):
+        self._stopped.set()
@@ -0,0 +1,74 @@
+import unittest
+from collision import ArmGeometry, CollisionChecker, OccupancyGrid, build_grid
+
+
+class TestOccupancyGrid(unittest.TestCase):
+
+    def test_index(self):
+        grid = OccupancyGrid(radius=100, height=100, resolution=10, floor=0)
+        self.assertEqual(grid.index(-100, -100, 0), 0)
+        self.assertEqual(grid.index(-89, -100, 0), 1)
+        self.assertEqual(grid.index(-100, -89, 0), grid.nx)
+        self.assertEqual(grid.index(-100, -100, 10), grid.nx * grid.ny)
+        self.assertEqual(grid.index(100, 0, 50), -1)
+        self.assertEqual(grid.index(0, 0, -1), -1)
+
+    def test_outside_is_occupied(self):
+        grid = OccupancyGrid(radius=100, height=100, resolution=10)
+        self.assertFalse(grid.occupied(0, 0, 50))
+        self.assertTrue(grid.occupied(0, 0, 150))
+
+    def test_shapes(self):
+        grid = OccupancyGrid(radius=100, height=100, resolution=10, floor=0)
+        grid.add_box((-100, -100, 0), (100, 100, 10))
+        grid.add_cylinder(30, 0, 60)
+        self.assertTrue(grid.occupied(50, 50, 5))
+        self.assertFalse(grid.occupied(50, 50, 25))
+        self.assertTrue(grid.occupied(0, 20, 55))
+        self.assertFalse(grid.occupied(0, 40, 55))
+        self.assertFalse(grid.occupied(0, 0, 75))
+
+
+class TestCollisionChecker(unittest.TestCase):
+
+    def setUp(self):
+        self.checker = CollisionChecker(build_grid(), ArmGeometry(), lookahead=0.5)
+
+    def test_home_pose_is_clear(self):
+        self.assertEqual(self.checker.collisions(0, 0, 0, 0), 0)
+        self.assertEqual(self.checker.collisions(90, 0, 0, 0), 0)
+
+    def test_full_reach_upwards_is_clear(self):
+        # the workspace boundary mustn't cut off the arm's own reach
+        self.assertEqual(self.checker.collisions(0, 0, 90, 0), 0)
+
+    def test_grabber_into_table(self):
+        # leaning forwards with forearm and grabber pointing down
+        self.assertGreater(self.checker.collisions(0, 60, -60, -60), 0)
+
+    def test_grabber_into_base(self):
+        # forearm folded down along the upper arm
+        self.assertGreater(self.checker.collisions(0, 0, -90, 0), 0)
+
+    def test_free_motion_is_not_scaled(self):
+        self.assertEqual(self.checker.scale((0, 0, 0, 0), (0, 0, 20, 0)), 1.0)
+
+    def test_motion_into_collision_is_scaled_down(self):
+        checker = self.checker
+        # forearm folding down towards the base, which it hits around -75 degrees
+        self.assertEqual(checker.collisions(0, 0, -40, 0), 0)
+        self.assertGreater(checker.collisions(0, 0, -90, 0), 0)
+        self.assertEqual(checker.scale((0, 0, -40, 0), (0, 0, -200, 0)), 0.25)
+        self.assertEqual(checker.scale((0, 0, -65, 0), (0, 0, -200, 0)), 0.0)
+
+    def test_can_back_out_of_collision(self):
+        angles = (0, 0, -90, 0)
+        self.assertEqual(self.checker.scale(angles, (0, 0, 100, 0)), 1.0)
+        self.assertEqual(self.checker.scale(angles, (0, 0, -30, 0)), 0.0)
+
+    def test_back_out_towards_last_clear_pose(self):
+        checker = self.checker
+        checker.scale((0, 0, -50, 0), (0, 0, -20, 0))
+        self.assertEqual(checker.scale((0, 0, -80, 0), (0, 0, 10, 0)), 1.0)
+        self.assertEqual(checker.scale((0, 0, -80, 0), (0, 0, -10, 0)), 0.0)
+        self.assertEqual(checker.scale((0, 0, -80, 0), (0, 0, 0, 20)), 0.0)
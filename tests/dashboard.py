@@ -0,0 +1,83 @@
+import http.client
+import json
+import queue
+import unittest
+from dashboard import Dashboard, delta
+
+
+class TestDelta(unittest.TestCase):
+
+    def test_only_changes(self):
+        self.assertEqual(delta({'a': 1, 'b': 2}, {'a': 1, 'b': 3, 'c': None}), {'b': 3, 'c': None})
+        self.assertEqual(delta({'a': 1}, {'a': 1}), {})
+
+
+class TestDashboard(unittest.TestCase):
+
+    def setUp(self):
+        self.state = {'pitch.position': 0, 'battery.local.volts': 7.9}
+        self.dashboard = Dashboard(lambda: dict(self.state), port=0, address='127.0.0.1', max_rate=50)
+
+    def tearDown(self):
+        self.dashboard.stop()
+
+    def read_event(self, response):
+        line = response.readline()
+        while not line.startswith(b'data: '):
+            line = response.readline()
+        return json.loads(line[len(b'data: '):].decode('utf-8'))
+
+    def test_publish_sends_changes_only(self):
+        self.assertEqual(self.dashboard.publish(), self.state)
+        self.assertIsNone(self.dashboard.publish())
+        self.state['pitch.position'] = 20
+        self.assertEqual(self.dashboard.publish(), {'pitch.position': 20})
+        self.assertEqual(self.dashboard.frames, 2)
+
+    def test_page(self):
+        self.dashboard.start()
+        connection = http.client.HTTPConnection('127.0.0.1', self.dashboard.port, timeout=5)
+        connection.request('GET', '/')
+        response = connection.getresponse()
+        self.assertEqual(response.status, 200)
+        self.assertIn(b'EventSource', response.read())
+        connection.close()
+
+    def test_event_stream(self):
+        self.dashboard.publish()
+        self.dashboard.start()
+        connection = http.client.HTTPConnection('127.0.0.1', self.dashboard.port, timeout=5)
+        connection.request('GET', '/events')
+        response = connection.getresponse()
+        self.assertEqual(response.getheader('Content-Type'), 'text/event-stream')
+
+        # full state first, then only what changed
+        self.assertEqual(self.read_event(response), self.state)
+        self.state['pitch.position'] = 20
+        self.assertEqual(self.read_event(response), {'pitch.position': 20})
+        connection.close()
+
+    def test_new_client_starts_from_published_state(self):
+        self.dashboard.publish()
+        self.dashboard.start()
+        # changes after the last frame reach new clients as a delta, like everyone else
+        self.state['pitch.position'] = 2
+        connection = http.client.HTTPConnection('127.0.0.1', self.dashboard.port, timeout=5)
+        connection.request('GET', '/events')
+        response = connection.getresponse()
+        self.assertEqual(self.read_event(response)['pitch.position'], 0)
+        self.assertEqual(self.read_event(response), {'pitch.position': 2})
+        connection.close()
+
+    def test_slow_client_is_dropped(self):
+        dashboard = Dashboard(lambda: dict(self.state), port=0, address='127.0.0.1', client_queue_size=1)
+        try:
+            client = queue.Queue(1)
+            dashboard.clients.append(client)
+            self.state['pitch.position'] = 1
+            dashboard.publish()
+            self.state['pitch.position'] = 2
+            dashboard.publish()
+            self.assertEqual(dashboard.clients, [])
+        finally:
+            dashboard.stop()
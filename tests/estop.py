@@ -0,0 +1,89 @@
+import threading
+import time
+import unittest
+from estop import BrickStop, emergency_stop, stop_motors
+
+
+class FakeMotor(object):
+    def __init__(self, stops=True):
+        self.stops = stops
+        self.is_running = True
+        self.reset_called = False
+
+    def stop(self):
+        if self.stops:
+            self.is_running = False
+
+    def reset(self):
+        self.reset_called = True
+        self.is_running = False
+
+
+class TestStopMotors(unittest.TestCase):
+
+    def test_all_confirmed(self):
+        motors = (FakeMotor(), FakeMotor())
+        results = stop_motors(motors)
+        self.assertEqual([result[:2] for result in results], [(True, False), (True, False)])
+        self.assertFalse(any(motor.reset_called for motor in motors))
+
+    def test_stuck_motor_gets_reset(self):
+        stuck = FakeMotor(stops=False)
+        results = stop_motors((FakeMotor(), stuck), confirm_timeout=0.02)
+        self.assertEqual(results[1][:2], (False, True))
+        self.assertTrue(stuck.reset_called)
+        self.assertFalse(stuck.is_running)
+
+
+class TestEmergencyStop(unittest.TestCase):
+
+    def test_bricks_stop_in_parallel(self):
+        barrier = threading.Barrier(2, timeout=1)
+
+        def stop():
+            barrier.wait()
+            return ((True, False, 0.0),)
+
+        reports = emergency_stop([BrickStop('a', ['x'], stop), BrickStop('b', ['y'], stop)])
+        self.assertTrue(all(report.ok for report in reports))
+
+    def test_hung_brick_times_out_and_escalates(self):
+        release = threading.Event()
+        dropped = []
+        reports = emergency_stop([
+            BrickStop('local', ['x'], lambda: ((True, False, 0.0),)),
+            BrickStop('remote', ['y', 'z'], release.wait, on_timeout=lambda: dropped.append(True)),
+        ], deadline=0.05)
+        release.set()
+
+        self.assertTrue(reports[0].ok)
+        self.assertTrue(reports[1].timed_out)
+        self.assertEqual(reports[1].unconfirmed, ['y', 'z'])
+        self.assertEqual(dropped, [True])
+        self.assertGreaterEqual(reports[1].latency, 0.05)
+
+    def test_error_is_reported(self):
+        def stop():
+            raise IOError('connection lost')
+
+        report = emergency_stop([BrickStop('remote', ['y'], stop)])[0]
+        self.assertFalse(report.ok)
+        self.assertIsInstance(report.error, IOError)
+
+    def test_late_answer_does_not_change_report(self):
+        release = threading.Event()
+        answered = threading.Event()
+
+        def stop():
+            release.wait()
+            answered.set()
+            return ((True, False, 0.0),)
+
+        report = emergency_stop([BrickStop('remote', ['y'], stop)], deadline=0.02)[0]
+        latency = report.latency
+        release.set()
+        answered.wait(1)
+        time.sleep(0.01)
+        self.assertTrue(report.timed_out)
+        self.assertIsNone(report.results)
+        self.assertEqual(report.latency, latency)
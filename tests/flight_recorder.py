@@ -0,0 +1,49 @@
+import logging
+import os
+import queue
+import tempfile
+import time
+import unittest
+from flight_recorder import DeferredQueueHandler, FlightRecorder, FlightRecorderHandler
+
+
+class TestFlightRecorder(unittest.TestCase):
+
+    def test_keeps_only_last_events(self):
+        recorder = FlightRecorder(size=4)
+        for i in range(10):
+            recorder.record('event %d', i)
+        self.assertEqual([event[3] for event in recorder.events()], [(6,), (7,), (8,), (9,)])
+
+    def test_events_since(self):
+        recorder = FlightRecorder(size=4)
+        recorder.record('old')
+        recorder._events[0] = (time.time() - 60,) + recorder._events[0][1:]
+        recorder.record('new')
+        self.assertEqual([event[2] for event in recorder.events(seconds=30)], ['new'])
+
+    def test_dump_formats_events(self):
+        recorder = FlightRecorder()
+        recorder.record('speed %s', 25, level=logging.INFO)
+        recorder.record('bad args %d', 'x')
+        with tempfile.TemporaryDirectory() as directory:
+            path = recorder.dump(os.path.join(directory, 'dump.log'))
+            with open(path) as f:
+                lines = f.read().splitlines()
+        self.assertTrue(lines[0].endswith('INFO speed 25'))
+        self.assertTrue(lines[1].endswith("DEBUG bad args %d ('x',)"))
+
+    def test_handler_records_unformatted(self):
+        recorder = FlightRecorder()
+        logger = logging.getLogger('test_flight_recorder')
+        logger.propagate = False
+        logger.addHandler(FlightRecorderHandler(recorder))
+        logger.warning('battery %sV', 7.2)
+        self.assertEqual(recorder.events()[0][1:], (logging.WARNING, 'battery %sV', (7.2,)))
+
+    def test_queue_handler_defers_formatting(self):
+        log_queue = queue.Queue()
+        handler = DeferredQueueHandler(log_queue)
+        handler.emit(logging.makeLogRecord({'msg': 'speed %s', 'args': (10,)}))
+        record = log_queue.get_nowait()
+        self.assertEqual((record.msg, record.args), ('speed %s', (10,)))
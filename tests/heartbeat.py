@@ -0,0 +1,33 @@
+import json
+import socket
+import unittest
+from heartbeat import Heartbeat, parse_address
+
+
+class TestHeartbeat(unittest.TestCase):
+
+    def test_quiet_without_status(self):
+        heartbeat = Heartbeat(('127.0.0.1', 9), 'arm', lambda: None)
+        self.addCleanup(heartbeat.sock.close)
+        self.assertFalse(heartbeat.send())
+
+        def broken():
+            raise IOError('brick gone')
+        heartbeat.status = broken
+        self.assertFalse(heartbeat.send())
+
+    def test_parse_address(self):
+        self.assertEqual(parse_address('10.42.0.1:5100'), ('10.42.0.1', 5100))
+        self.assertEqual(parse_address('5100'), ('127.0.0.1', 5100))
+
+    def test_send(self):
+        receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.addCleanup(receiver.close)
+        receiver.bind(('127.0.0.1', 0))
+        receiver.settimeout(1)
+        heartbeat = Heartbeat(receiver.getsockname(), 'left', lambda: {'late_ticks': 0})
+        self.addCleanup(heartbeat.sock.close)
+        self.assertTrue(heartbeat.send())
+        self.assertTrue(heartbeat.send())
+        message = json.loads(receiver.recv(65536).decode('utf-8'))
+        self.assertEqual((message['name'], message['sequence'], message['status']), ('left', 0, {'late_ticks': 0}))
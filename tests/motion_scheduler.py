@@ -0,0 +1,128 @@
+import time
+import unittest
+from motion_scheduler import Joint, MotionAborted, MotionScheduler, Move, Task
+
+
+class FakeMotor(object):
+    """ reaches its target `duration` seconds after being started """
+
+    def __init__(self, duration=0.03):
+        self.duration = duration
+        self.position = 0
+        self.target = 0
+        self.started = None
+        self.starts = []
+
+    def start(self, position, speed):
+        self.target = position
+        self.started = time.time()
+        self.starts.append((position, self.started))
+
+    def state(self):
+        if self.started is not None and time.time() - self.started >= self.duration:
+            self.position = self.target
+            self.started = None
+        return self.position, self.started is not None
+
+
+def joints(**motors):
+    return [Joint(name, 'brick', motor.start, motor.state) for name, motor in motors.items()]
+
+
+class TestMotionScheduler(unittest.TestCase):
+
+    def test_independent_moves_overlap(self):
+        waist, pitch = FakeMotor(0.05), FakeMotor(0.05)
+        task = Task('reach', [Move('waist', 100, 50), Move('pitch', 50, 10)])
+        start = time.time()
+        MotionScheduler(joints(waist=waist, pitch=pitch), poll_interval=0.005).run([task])
+        # one after the other would take at least 0.1s
+        self.assertLess(time.time() - start, 0.09)
+        self.assertEqual((waist.position, pitch.position), (100, 50))
+        self.assertLess(abs(waist.starts[0][1] - pitch.starts[0][1]), 0.01)
+
+    def test_dependencies_are_respected(self):
+        waist, shoulder = FakeMotor(), FakeMotor()
+        turn = Move('waist', 100, 50)
+        reach = Move('shoulder', -300, 50, after=[turn])
+        MotionScheduler(joints(waist=waist, shoulder=shoulder), poll_interval=0.005).run([Task('t', [turn, reach])])
+        self.assertGreaterEqual(reach.started, turn.finished)
+
+    def test_same_joint_moves_run_in_order(self):
+        waist = FakeMotor()
+        first, second = Move('waist', 100, 50), Move('waist', 0, 50)
+        MotionScheduler(joints(waist=waist), poll_interval=0.005).run([Task('a', [first]), Task('b', [second])])
+        self.assertEqual([position for position, _ in waist.starts], [100, 0])
+        self.assertGreaterEqual(second.started, first.finished)
+
+    def test_next_task_starts_early(self):
+        waist, shoulder, pitch = FakeMotor(), FakeMotor(0.05), FakeMotor()
+        retract = Move('shoulder', 0, 50, after=[])
+        current = Task('pick', [Move('shoulder', -100, 50), retract])
+        tilt = Move('pitch', 30, 10)
+        turn = Move('waist', 100, 50, after=[retract])
+        following = Task('place', [turn, tilt])
+
+        tasks = MotionScheduler(joints(waist=waist, shoulder=shoulder, pitch=pitch), poll_interval=0.005).run(
+            [current, following])
+        # the pitch move of the next task doesn't wait for the current one
+        self.assertLess(tilt.started, current.finished)
+        self.assertGreaterEqual(turn.started, retract.finished)
+        self.assertTrue(all(task.cycle_time > 0 for task in tasks))
+
+    def test_timeout_aborts(self):
+        stuck, pitch, waist = FakeMotor(duration=10), FakeMotor(duration=10), FakeMotor()
+        stopped = []
+        joints = [Joint(name, 'brick', motor.start, motor.state, stop=lambda name=name: stopped.append(name))
+                  for name, motor in (('shoulder', stuck), ('pitch', pitch), ('waist', waist))]
+        retract = Move('shoulder', 0, 50)
+        tilt = Move('pitch', 30, 10)
+        turn = Move('waist', 100, 50, after=[retract])
+        scheduler = MotionScheduler(joints, poll_interval=0.005, move_timeout=0.02)
+        with self.assertRaises(MotionAborted) as aborted:
+            scheduler.run([Task('t', [retract, tilt, turn])])
+        self.assertIs(aborted.exception.move, retract)
+        self.assertTrue(retract.timed_out)
+        self.assertIsNone(retract.finished)
+        # everything running is stopped, and the waist never swings while the shoulder is out
+        self.assertEqual(sorted(stopped), ['pitch', 'shoulder'])
+        self.assertIsNone(turn.started)
+        self.assertEqual(waist.starts, [])
+
+    def test_abort_check(self):
+        waist = FakeMotor(duration=10)
+        reasons = [None, 'waist jammed']
+        scheduler = MotionScheduler(joints(waist=waist), poll_interval=0.005, abort_check=lambda: reasons.pop(0))
+        with self.assertRaises(MotionAborted) as aborted:
+            scheduler.run([Task('t', [Move('waist', 100, 50)])])
+        self.assertEqual(str(aborted.exception), 'waist jammed')
+
+    def test_grip_finishes_on_stall(self):
+        grabber, shoulder = FakeMotor(duration=10), FakeMotor()
+        stopped = []
+        grabber_joint = Joint('grabber', 'brick', grabber.start, grabber.state,
+                              stop=lambda: stopped.append(True), stalled=lambda: grabber.started is not None)
+        grip = Move('grabber', -1600, 50, grip=True)
+        retract = Move('shoulder', 0, 50, after=[grip])
+        scheduler = MotionScheduler([grabber_joint] + joints(shoulder=shoulder), poll_interval=0.005, move_timeout=1)
+        scheduler.run([Task('pick', [grip, retract])])
+        self.assertTrue(grip.gripped)
+        self.assertEqual(stopped, [True])
+        self.assertIsNotNone(retract.finished)
+
+    def test_stall_is_not_done_without_grip(self):
+        grabber = FakeMotor(duration=10)
+        grabber_joint = Joint('grabber', 'brick', grabber.start, grabber.state, stalled=lambda: True)
+        scheduler = MotionScheduler([grabber_joint], poll_interval=0.005, move_timeout=0.05)
+        with self.assertRaises(MotionAborted):
+            scheduler.run([Task('t', [Move('grabber', 0, 50)])])
+
+    def test_unknown_state_is_not_done(self):
+        joint = Joint('pitch', 'brick', lambda position, speed: None, lambda: None)
+        self.assertFalse(joint.reached(0))
+
+    def test_unsatisfiable_dependency(self):
+        waist = FakeMotor()
+        orphan = Move('waist', 1, 1)
+        with self.assertRaises(ValueError):
+            MotionScheduler(joints(waist=waist), poll_interval=0.001).run([Task('t', [Move('waist', 5, 1, after=[orphan])])])
@@ -0,0 +1,64 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from sampling_profiler import SamplingProfiler
+
+
+def busy_wait(stop):
+    while not stop.is_set():
+        stop.wait(0.001)
+
+
+class TestSamplingProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=busy_wait, args=(self.stop,), name='Worker')
+        self.thread.start()
+
+    def tearDown(self):
+        self.stop.set()
+        self.thread.join()
+
+    def test_samples_are_tagged_by_thread(self):
+        profiler = SamplingProfiler(thread_tags={'Worker': 'control tick'})
+        profiler.sample()
+        profiler.sample()
+        worker = [key for key in profiler.samples if key[1] == 'Worker']
+        self.assertEqual(len(worker), 1)
+        self.assertEqual(worker[0][0], 'control tick')
+        self.assertEqual(profiler.samples[worker[0]], 2)
+        self.assertEqual(profiler.sample_count, 2)
+
+    def test_frame_tag_overrides_thread_tag(self):
+        profiler = SamplingProfiler(thread_tags={'Worker': 'control tick'},
+                                    frame_tags=[('sampling_profiler', 'remote I/O')])
+        profiler.sample()
+        tags = {key[0] for key in profiler.samples if key[1] == 'Worker'}
+        self.assertEqual(tags, {'remote I/O'})
+
+    def test_collapsed_output(self):
+        profiler = SamplingProfiler(thread_tags={'Worker': 'control tick'})
+        profiler.sample()
+        with tempfile.TemporaryDirectory() as directory:
+            path = profiler.write(os.path.join(directory, 'profile.collapsed'))
+            with open(path) as f:
+                lines = f.read().splitlines()
+        worker = [line for line in lines if line.startswith('control tick;Worker;')]
+        self.assertEqual(len(worker), 1)
+        stack, count = worker[0].rsplit(' ', 1)
+        self.assertEqual(count, '1')
+        self.assertTrue(any(frame.startswith('busy_wait (') for frame in stack.split(';')))
+
+    def test_runs_in_background(self):
+        profiler = SamplingProfiler(interval=0.001)
+        profiler.start()
+        deadline = time.time() + 2
+        while profiler.sample_count < 3 and time.time() < deadline:
+            self.stop.wait(0.001)
+        profiler.stop()
+        profiler.join()
+        self.assertGreaterEqual(profiler.sample_count, 3)
+        self.assertGreater(profiler.overhead, 0)
@@ -0,0 +1,65 @@
+import unittest
+from setpoint_filter import SetpointFilter
+
+
+RATE = 50
+
+
+def run(joint_filter, target, ticks):
+    return [joint_filter.update(target) for _ in range(ticks)]
+
+
+class TestSetpointFilter(unittest.TestCase):
+
+    def test_reaches_target(self):
+        joint_filter = SetpointFilter(RATE, quantum=1)
+        outputs = run(joint_filter, 50, RATE)
+        self.assertEqual(outputs[-1], 50)
+        self.assertEqual(joint_filter.speed, 50)
+
+    def test_acceleration_is_limited(self):
+        joint_filter = SetpointFilter(RATE, max_accel=100, max_jerk=10000, quantum=1)
+        speeds = []
+        for _ in range(RATE):
+            joint_filter.update(80)
+            speeds.append(joint_filter.speed)
+        steps = [b - a for a, b in zip([0.0] + speeds, speeds)]
+        self.assertLessEqual(max(steps), 100.0 / RATE + 1e-9)
+
+    def test_jerk_is_limited(self):
+        joint_filter = SetpointFilter(RATE, max_accel=200, max_jerk=1000, quantum=1)
+        speeds = [0.0]
+        for target in [40] * RATE + [-40] * 2 * RATE:
+            joint_filter.update(target)
+            speeds.append(joint_filter.speed)
+        steps = [b - a for a, b in zip(speeds, speeds[1:])]
+        step_changes = [abs(b - a) for a, b in zip([0.0] + steps, steps)]
+        self.assertLessEqual(max(step_changes), 1000.0 / RATE ** 2 + 1e-9)
+
+    def test_no_overshoot(self):
+        joint_filter = SetpointFilter(RATE, quantum=1)
+        outputs = run(joint_filter, 25, RATE) + run(joint_filter, 0, RATE)
+        self.assertLessEqual(max(outputs), 25)
+        self.assertGreaterEqual(min(outputs), 0)
+        self.assertEqual(outputs[-1], 0)
+
+    def test_output_is_quantized(self):
+        joint_filter = SetpointFilter(RATE, quantum=5)
+        outputs = run(joint_filter, 60, RATE)
+        self.assertTrue(all(output % 5 == 0 for output in outputs))
+
+    def test_changed_only_on_new_output(self):
+        joint_filter = SetpointFilter(RATE, quantum=4)
+        run(joint_filter, 40, RATE)
+        commands = 0
+        # stick jitter around the same value
+        for target in [40, 40.6, 39.4, 41, 40] * 10:
+            joint_filter.update(target)
+            commands += joint_filter.changed
+        self.assertEqual(commands, 0)
+
+    def test_reset(self):
+        joint_filter = SetpointFilter(RATE)
+        run(joint_filter, 50, 5)
+        joint_filter.reset()
+        self.assertEqual((joint_filter.speed, joint_filter.output, joint_filter.changed), (0, 0, False))
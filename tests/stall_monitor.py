@@ -0,0 +1,70 @@
+import time
+import unittest
+from stall_monitor import StallMonitor
+
+
+class TestStallMonitor(unittest.TestCase):
+
+    def setUp(self):
+        self.stopped = []
+        self.monitor = StallMonitor(lambda: {}, self.stopped.append, rate=10, stall_samples=3, backoff_time=1.0)
+
+    def test_cut_after_consecutive_samples(self):
+        for now in (0.0, 0.1):
+            self.assertEqual(self.monitor.update({'spin': (True, True, 0, 50)}, now), [])
+        self.assertEqual(self.monitor.update({'spin': (True, True, 0, 50)}, 0.2), ['spin'])
+        self.assertEqual(self.stopped, ['spin'])
+        self.assertEqual(len(self.monitor.events), 1)
+
+    def test_recovery_resets_the_count(self):
+        self.monitor.update({'spin': (True, True, 0, 50)}, 0.0)
+        self.monitor.update({'spin': (True, True, 0, 50)}, 0.1)
+        self.monitor.update({'spin': (False, True, 200, 50)}, 0.2)
+        self.monitor.update({'spin': (True, True, 0, 50)}, 0.3)
+        self.assertEqual(self.stopped, [])
+
+    def test_driven_but_not_turning(self):
+        self.assertTrue(self.monitor.jammed(False, True, 5, -80))
+        self.assertFalse(self.monitor.jammed(False, True, 300, -80))
+        # holding still at low duty cycle is fine
+        self.assertFalse(self.monitor.jammed(False, True, 0, 10))
+
+    def test_holding_against_a_load_is_not_jammed(self):
+        self.assertFalse(self.monitor.jammed(False, False, 0, -80))
+        for now in (0.0, 0.1, 0.2):
+            self.monitor.update({'grabber': (False, False, 0, -60)}, now)
+        self.assertEqual(self.stopped, [])
+        # unless the driver itself reports a stall
+        self.assertTrue(self.monitor.jammed(True, False, 0, -80))
+
+    def test_backoff_blocks_the_jammed_direction_only(self):
+        for now in (0.0, 0.1, 0.2):
+            self.monitor.update({'grabber': (True, True, 0, -60)}, now)
+        self.assertTrue(self.monitor.blocked('grabber', -100, 0.5))
+        self.assertFalse(self.monitor.blocked('grabber', 100, 0.5))
+        self.assertFalse(self.monitor.blocked('grabber', 0, 0.5))
+        self.assertFalse(self.monitor.blocked('grabber', -100, 1.3))
+        self.assertFalse(self.monitor.blocked('waist', -100, 0.5))
+
+    def test_failing_stop_is_logged(self):
+        def on_stall(name):
+            raise IOError('brick gone')
+        monitor = StallMonitor(lambda: {}, on_stall, stall_samples=1)
+        with self.assertLogs('stall_monitor', 'ERROR'):
+            self.assertEqual(monitor.update({'roll': (True, True, 0, 40)}, 0.0), ['roll'])
+
+    def test_period_stretches_to_stay_within_budget(self):
+        def slow_sample():
+            time.sleep(0.02)
+            return {}
+        monitor = StallMonitor(slow_sample, self.stopped.append, rate=10, budget=0.05, max_period=0.5)
+        self.assertAlmostEqual(monitor.reaction_time, 0.3)
+        monitor.start()
+        try:
+            deadline = time.time() + 1
+            while monitor.period == monitor.min_period and time.time() < deadline:
+                time.sleep(0.01)
+        finally:
+            monitor.stop()
+        self.assertGreater(monitor.period, 0.3)
+        self.assertGreater(monitor.reaction_time, 0.9)
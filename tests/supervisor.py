@@ -0,0 +1,161 @@
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+from heartbeat import Heartbeat
+from supervisor import Arm, Supervisor, load_config
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# A simulated arm: heartbeats like remote_control.py, optionally going quiet (hung) after a while
+ARM = """
+import signal
+signal.signal(signal.SIGINT, signal.SIG_IGN)  # a hung arm doesn't shut down cleanly either
+import sys, time
+sys.path.insert(0, sys.argv[1])
+from heartbeat import Heartbeat, parse_address
+hang_after = float(sys.argv[4])
+started = time.time()
+heartbeat = Heartbeat(parse_address(sys.argv[3]), sys.argv[2],
+                      lambda: {'ok': True} if not hang_after or time.time() - started < hang_after else None,
+                      interval=0.02)
+heartbeat.start()
+time.sleep(60)
+"""
+
+
+def simulated_arm(name, hang_after=0, cpus=None):
+    return Arm(name, [sys.executable, '-c', ARM, ROOT, '{name}', '{health}', str(hang_after)], cpus)
+
+
+class TestSupervisor(unittest.TestCase):
+
+    def setUp(self):
+        self.supervisor = None
+
+    def tearDown(self):
+        if self.supervisor:
+            self.supervisor.stop_timeout = 0.5
+            self.supervisor.shutdown()
+
+    def supervise(self, arms, **kwargs):
+        options = dict(heartbeat_timeout=0.3, startup_timeout=5, stop_timeout=0.2, min_restart_delay=0.05,
+                       poll_interval=0.01)
+        options.update(kwargs)
+        self.supervisor = Supervisor(arms, **options)
+        return self.supervisor
+
+    def run_until(self, condition, timeout=5):
+        deadline = time.time() + timeout
+        while not condition() and time.time() < deadline:
+            self.supervisor.step()
+        return condition()
+
+    def test_all_arms_come_up(self):
+        supervisor = self.supervise([simulated_arm('left'), simulated_arm('middle'), simulated_arm('right')])
+        self.assertTrue(self.run_until(lambda: all(arm.state == 'ok' for arm in supervisor.arms.values())))
+        health = supervisor.health()
+        self.assertEqual(len(set(arm['pid'] for arm in health.values())), 3)
+        self.assertEqual(health['left']['status'], {'ok': True})
+        self.assertEqual(supervisor.snapshot()['arms.ok'], 3)
+
+    def test_exited_arm_is_restarted(self):
+        crashing = Arm('crashing', [sys.executable, '-c', 'import sys; sys.exit(1)'])
+        supervisor = self.supervise([crashing, simulated_arm('healthy')])
+        self.assertTrue(self.run_until(lambda: crashing.restarts >= 2))
+        # restarts back off
+        self.assertGreater(crashing.restart_delay, supervisor.min_restart_delay)
+        self.assertEqual(supervisor.arms['healthy'].restarts, 0)
+
+    def test_clean_exit_is_not_restarted(self):
+        finished = Arm('finished', [sys.executable, '-c', 'pass'])
+        supervisor = self.supervise([finished])
+        self.assertTrue(self.run_until(lambda: finished.state == 'exited'))
+        for _ in range(10):
+            supervisor.step()
+        self.assertEqual(finished.state, 'exited')
+        self.assertIsNone(finished.pid)
+        self.assertEqual(finished.restarts, 0)
+
+    def test_clean_exit_restarts_when_asked(self):
+        finished = Arm('finished', [sys.executable, '-c', 'pass'], restart_on_exit=True)
+        self.supervise([finished])
+        self.assertTrue(self.run_until(lambda: finished.restarts >= 1))
+
+    def test_hung_arm_is_killed_and_restarted(self):
+        hung = simulated_arm('hung', hang_after=0.2)
+        healthy = simulated_arm('healthy')
+        supervisor = self.supervise([hung, healthy])
+        self.assertTrue(self.run_until(lambda: hung.state == 'ok' and healthy.state == 'ok'))
+        first_pid = hung.pid
+
+        # watch the healthy arm's heartbeats while the other one hangs and gets replaced
+        max_gap = 0
+        deadline = time.time() + 5
+        while (hung.restarts == 0 or hung.state != 'ok') and time.time() < deadline:
+            supervisor.step()
+            max_gap = max(max_gap, time.time() - healthy.last_heartbeat)
+        self.assertEqual(hung.restarts, 1)
+        self.assertNotEqual(hung.pid, first_pid)
+        self.assertEqual(healthy.restarts, 0)
+        self.assertLess(max_gap, supervisor.heartbeat_timeout)
+
+    @unittest.skipUnless(hasattr(os, 'sched_getaffinity'), 'no CPU affinity on this platform')
+    def test_cpu_affinity(self):
+        cpu = min(os.sched_getaffinity(0))
+        arm = simulated_arm('pinned', cpus=[cpu])
+        self.supervise([arm])
+        self.supervisor.step()
+        self.assertEqual(os.sched_getaffinity(arm.pid), {cpu})
+
+    def test_foreign_heartbeats_are_ignored(self):
+        arm = Arm('left', [sys.executable, '-c', 'import time; time.sleep(60)'])
+        supervisor = self.supervise([arm], startup_timeout=60)
+        supervisor.step()
+        for name in ('left', 'unknown'):  # wrong pid, unknown arm
+            heartbeat = Heartbeat(supervisor.health_address, name, lambda: {})
+            heartbeat.send()
+            heartbeat.sock.close()
+        supervisor.receive(0.05)
+        self.assertIsNone(arm.last_heartbeat)
+
+
+class TestConfig(unittest.TestCase):
+
+    def load(self, config):
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            json.dump(config, f)
+        try:
+            return load_config(f.name)
+        finally:
+            os.remove(f.name)
+
+    def test_load_config(self):
+        arms, options = self.load({'health_port': 0, 'heartbeat_timeout': 2, 'arms': [
+            {'name': 'left', 'remote_host': '10.42.0.3', 'gamepad': '/dev/input/event2', 'cpu': 1,
+             'args': ['--dashboard', '8081'], 'restart_on_exit': True},
+            {'name': 'sim', 'command': ['python3', 'sim.py', '{health}'], 'cpu': [2, 3]},
+        ]})
+
+        self.assertEqual(options, {'health_port': 0, 'heartbeat_timeout': 2})
+        left, sim = arms
+        self.assertEqual(left.cpus, {1})
+        self.assertEqual(left.command[2:], ['--name', '{name}', '--health', '{health}', '--remote-host', '10.42.0.3',
+                                            '--gamepad', '/dev/input/event2', '--telemetry-port', '5005',
+                                            '--dashboard', '8081'])
+        self.assertTrue(left.command[1].endswith('remote_control.py'))
+        self.assertTrue(left.restart_on_exit)
+        self.assertFalse(sim.restart_on_exit)
+        self.assertEqual(sim.command, ['python3', 'sim.py', '{health}'])
+        self.assertEqual(sim.cpus, {2, 3})
+
+    def test_telemetry_ports(self):
+        arms, _ = self.load({'arms': [{'name': 'left'}, {'name': 'middle', 'args': ['--telemetry-port', '6000']},
+                                      {'name': 'right'}]})
+        ports = [arm.command[arm.command.index('--telemetry-port') + 1] for arm in arms]
+        self.assertEqual(ports, ['5005', '6000', '5007'])
+
+        with self.assertRaises(ValueError):
+            self.load({'arms': [{'name': 'left', 'args': ['--telemetry-port', '5006']}, {'name': 'right'}]})
@@ -0,0 +1,125 @@
+import threading
+import time
+import unittest
+from telemetry import (FRAME, FRAME_FORMAT, OVERLOADED, PRESENT, RUNNING, LeaseRenewer, TelemetryMirror,
+                       decode_frame, push_state, renew_lease)
+
+
+class FakeMotor(object):
+    def __init__(self, position, speed, state, duty_cycle=0):
+        self.position = position
+        self.speed = speed
+        self.state = state
+        self.duty_cycle = duty_cycle
+
+
+class FakePower(object):
+    measured_volts = 7.8
+    measured_amps = 0.25
+
+
+def pack(sequence, pitch_flags=PRESENT, timestamp=None):
+    return FRAME.pack(timestamp or time.time(), sequence,
+                      10, 1, 5, PRESENT, 20, 2, -60, pitch_flags, 30, 3, 0, PRESENT, 0, 0, 0, 0, 7.5, 0.5)
+
+
+class TestTelemetryMirror(unittest.TestCase):
+
+    def setUp(self):
+        self.mirror = TelemetryMirror(0, max_age=0.25, bind_address='127.0.0.1')
+
+    def tearDown(self):
+        self.mirror.stop()
+
+    def test_decode(self):
+        frame = decode_frame(pack(3, PRESENT | RUNNING))
+        self.assertEqual(frame.sequence, 3)
+        self.assertEqual(tuple(frame.motors['pitch']), (20, 2, -60, PRESENT | RUNNING))
+        self.assertEqual(frame.motors['grabber'].flags, 0)
+        self.assertAlmostEqual(frame.volts, 7.5)
+
+    def test_stale_without_frames(self):
+        self.assertTrue(self.mirror.stale)
+        self.assertIsNone(self.mirror.motor('pitch'))
+
+    def test_latest_frame(self):
+        self.mirror.handle(pack(1, PRESENT | RUNNING))
+        self.assertTrue(self.mirror.motor('pitch').flags & RUNNING)
+        self.assertFalse(self.mirror.motor('roll').flags & RUNNING)
+        self.assertEqual(self.mirror.motor('spin').position, 30)
+
+    def test_out_of_order_frames_are_dropped(self):
+        now = time.time()
+        self.mirror.handle(pack(5, timestamp=now))
+        self.mirror.handle(pack(4, PRESENT | RUNNING, timestamp=now - 0.05))
+        self.assertEqual(self.mirror.frame.sequence, 5)
+        # a restarted sender starts counting from 0 again
+        self.mirror.handle(pack(0, timestamp=now + 0.05))
+        self.assertEqual(self.mirror.frame.sequence, 0)
+
+    def test_staleness(self):
+        self.mirror.handle(pack(1), received=time.time() - 1)
+        self.assertTrue(self.mirror.stale)
+        self.assertIsNone(self.mirror.motor('pitch'))
+        self.assertGreater(self.mirror.age, 0.9)
+
+    def test_garbage_is_ignored(self):
+        self.mirror.handle(b'garbage')
+        self.assertIsNone(self.mirror.frame)
+
+    def test_push_state_over_loopback(self):
+        self.mirror.start()
+        motors = (FakeMotor(100, 50, ['running']), FakeMotor(-20, 0, ['overloaded', 'holding'], 80),
+                  FakeMotor(0, 0, []), None)
+        stop = threading.Event()
+        sender = threading.Thread(target=push_state, args=(
+            motors, FakePower(), ('127.0.0.1', self.mirror.port), 0.01, FRAME_FORMAT, stop))
+        sender.start()
+        try:
+            deadline = time.time() + 2
+            while self.mirror.frame is None and time.time() < deadline:
+                time.sleep(0.01)
+        finally:
+            stop.set()
+            sender.join()
+
+        self.assertTrue(self.mirror.motor('roll').flags & RUNNING)
+        self.assertEqual(self.mirror.motor('roll').position, 100)
+        self.assertTrue(self.mirror.motor('pitch').flags & OVERLOADED)
+        self.assertEqual(self.mirror.motor('pitch').duty_cycle, 80)
+        self.assertFalse(self.mirror.motor('spin').flags & RUNNING)
+        self.assertEqual(self.mirror.motor('grabber').flags, 0)
+        self.assertAlmostEqual(self.mirror.frame.volts, 7.8, places=5)
+
+    def test_push_state_ends_with_its_lease(self):
+        self.mirror.start()
+        lease = [0.0]
+        renew_lease(lease, 0.1)
+        self.assertGreater(lease[0], time.monotonic())
+        sender = threading.Thread(target=push_state, args=(
+            (None,) * 4, FakePower(), ('127.0.0.1', self.mirror.port), 0.01, FRAME_FORMAT, threading.Event(), lease))
+        sender.start()
+        sender.join(2)
+        self.assertFalse(sender.is_alive())
+        self.assertIsNotNone(self.mirror.frame)
+
+
+class TestLeaseRenewer(unittest.TestCase):
+
+    def test_keeps_renewing_through_errors(self):
+        calls = []
+
+        def renew():
+            calls.append(time.time())
+            if len(calls) == 1:
+                raise EOFError('connection closed')
+
+        renewer = LeaseRenewer(renew, 0.005)
+        renewer.start()
+        deadline = time.time() + 2
+        while len(calls) < 3 and time.time() < deadline:
+            time.sleep(0.005)
+        renewer.stop()
+        renewer.join(1)
+        self.assertGreaterEqual(len(calls), 3)
+        self.assertFalse(renewer.is_alive())
@@ -0,0 +1,104 @@
+import collections
+import math
+import unittest
+from tilt_input import ABS_RX, ABS_X, ABS_Y, ABS_Z, EV_ABS, EV_SYN, TiltFilter, TiltInput, tilt_to_speed
+
+
+Event = collections.namedtuple('Event', 'type code value')
+
+
+def reference_filter(angle, rates, accel_angles, sample_rate, time_constant=0.5):
+    dt = 1.0 / sample_rate
+    alpha = time_constant / (time_constant + dt)
+    for rate, accel_angle in zip(rates, accel_angles):
+        angle = alpha * (angle + rate * dt) + (1 - alpha) * accel_angle
+    return angle
+
+
+class FakeDevice(object):
+    closed = False
+    before_read = None
+
+    def absinfo(self, code):
+        raise OSError('no absinfo')
+
+    def read(self):
+        if self.before_read:
+            self.before_read()
+        if self.closed:
+            raise OSError(9, 'Bad file descriptor')
+        raise BlockingIOError()
+
+
+class TestTiltFilter(unittest.TestCase):
+
+    def test_batch_matches_per_sample_filter(self):
+        rates = [math.sin(i / 10.0) * 50 for i in range(300)]
+        accel_angles = [math.cos(i / 7.0) * 30 for i in range(300)]
+        tilt_filter = TiltFilter(250, max_batch=64)
+        tilt_filter.update(rates[:1], accel_angles[:1])
+        # uneven batch sizes, including some larger than max_batch
+        start = 1
+        for size in [10, 1, 64, 100, 124]:
+            tilt_filter.update(rates[start:start + size], accel_angles[start:start + size])
+            start += size
+        expected = reference_filter(accel_angles[0], rates, accel_angles, 250)
+        self.assertAlmostEqual(tilt_filter.angle, expected)
+
+    def test_converges_to_accelerometer(self):
+        tilt_filter = TiltFilter(250)
+        tilt_filter.update([0.0], [0.0])
+        for _ in range(20):
+            tilt_filter.update([0.0] * 100, [20.0] * 100)
+        self.assertAlmostEqual(tilt_filter.angle, 20.0, places=3)
+
+
+class TestTiltToSpeed(unittest.TestCase):
+
+    def test_deadzone(self):
+        self.assertEqual(tilt_to_speed(10, deadzone=15), 0)
+        self.assertEqual(tilt_to_speed(-14.9, deadzone=15), 0)
+
+    def test_scaling(self):
+        self.assertEqual(tilt_to_speed(30, deadzone=15, full_angle=45, max_speed=20), 10)
+        self.assertEqual(tilt_to_speed(-90, deadzone=15, full_angle=45, max_speed=20), -20)
+
+
+class TestTiltInput(unittest.TestCase):
+
+    def events(self, ax, ay, az, rate=0):
+        return [Event(EV_ABS, ABS_X, ax), Event(EV_ABS, ABS_Y, ay), Event(EV_ABS, ABS_Z, az),
+                Event(EV_ABS, ABS_RX, rate), Event(EV_SYN, 0, 0)]
+
+    def test_tilt_forwards(self):
+        tilt_input = TiltInput(FakeDevice(), max_speed=1)
+        tilt_input.handle_events(self.events(0, 8192, 0) * 5)
+        tilt_input.filter_batch()
+        tilt_input.update_speeds()
+        self.assertEqual((tilt_input.pitch_speed, tilt_input.roll_speed), (0, 0))
+
+        # tilted 45 degrees forwards, held long enough for the filter to settle
+        for _ in range(100):
+            tilt_input.handle_events(self.events(0, 5793, 5793) * 10)
+            tilt_input.filter_batch()
+        tilt_input.update_speeds()
+        self.assertAlmostEqual(tilt_input.pitch_speed, 1, places=2)
+        self.assertEqual(tilt_input.roll_speed, 0)
+
+    def test_full_buffer_is_filtered(self):
+        tilt_input = TiltInput(FakeDevice(), max_batch=8)
+        tilt_input.handle_events(self.events(0, 8192, 0) * 20)
+        self.assertEqual(tilt_input.count, 4)
+        self.assertIsNotNone(tilt_input.pitch_filter.angle)
+
+    def test_closed_device_on_shutdown(self):
+        device = FakeDevice()
+        tilt_input = TiltInput(device, read_interval=0.001)
+
+        def shutdown():
+            # clean_shutdown() stopping the thread and closing the device while it sleeps
+            tilt_input.stop()
+            device.closed = True
+        device.before_read = shutdown
+        tilt_input.run()  # returns instead of raising
+        self.assertEqual((tilt_input.pitch_speed, tilt_input.roll_speed), (0, 0))
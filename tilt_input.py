@@ -0,0 +1,171 @@
+# PS4 motion sensor tilt input, kept free of ev3dev/evdev imports for easy unit testing
+import math
+import operator
+import threading
+import time
+from array import array
+
+# evdev event types and codes of the 'Wireless Controller Motion Sensors' device
+EV_SYN = 0
+EV_ABS = 3
+ABS_X, ABS_Y, ABS_Z = 0, 1, 2  # accelerometer
+ABS_RX, ABS_RY, ABS_RZ = 3, 4, 5  # gyro
+GYRO_RESOLUTION = 1024  # units per degree/second, used when the device doesn't report it
+
+
+class TiltFilter(object):
+    """ complementary filter fusing gyro rate and accelerometer angle, updated a batch at a time
+
+    Applying the per-sample filter angle = alpha * (angle + rate * dt) + (1 - alpha) * accel_angle to a
+    batch of n samples is the same as a weighted sum over the batch, so the weights are precomputed
+    once for the sample rate and every batch is just two dot products.
+    """
+
+    def __init__(self, sample_rate, time_constant=0.5, max_batch=128):
+        dt = 1.0 / sample_rate
+        alpha = time_constant / (time_constant + dt)
+        self.max_batch = max_batch
+        # weights for the last n samples of a batch are the last n entries
+        self.gyro_weights = array('d', (alpha ** (max_batch - i) * dt for i in range(max_batch)))
+        self.accel_weights = array('d', (alpha ** (max_batch - 1 - i) * (1 - alpha) for i in range(max_batch)))
+        self.decay = array('d', (alpha ** n for n in range(max_batch + 1)))
+        self.angle = None
+
+    def update(self, rates, accel_angles, count=None):
+        """ feed `count` samples of angular rate (deg/s) and accelerometer angle (deg), return the angle """
+        if count is None:
+            count = len(rates)
+        if self.angle is None and count:
+            self.angle = accel_angles[0]
+
+        start = 0
+        while start < count:
+            n = min(count - start, self.max_batch)
+            offset = self.max_batch - n
+            self.angle = (self.decay[n] * self.angle
+                          + sum(map(operator.mul, self.gyro_weights[offset:], rates[start:start + n]))
+                          + sum(map(operator.mul, self.accel_weights[offset:], accel_angles[start:start + n])))
+            start += n
+        return self.angle
+
+
+def tilt_to_speed(angle, deadzone=15, full_angle=45, max_speed=1):
+    """ scale a tilt angle to a motor speed, zero within the deadzone and capped at full_angle """
+    if -deadzone < angle < deadzone:
+        return 0
+    speed = (abs(angle) - deadzone) / (full_angle - deadzone) * max_speed
+    return math.copysign(min(speed, max_speed), angle)
+
+
+class TiltInput(threading.Thread):
+    """ read the controller's motion sensor in batches and publish decimated pitch/roll speeds
+
+    The IMU reports at a few hundred Hz; rather than handling every event, the thread wakes up every
+    `read_interval` to drain everything that arrived since, and at `output_rate` filters the collected
+    samples as one batch and updates `pitch_speed` and `roll_speed` for the control loop to pick up.
+
+    With the controller lying flat gravity is on the Y axis: tilting it forwards/backwards (rotation
+    around X) moves gravity to Z, tilting it sideways (rotation around Z) moves it to X.
+    """
+
+    def __init__(self, device, sample_rate=250, output_rate=25, read_interval=0.02, deadzone=15,
+                 full_angle=45, max_speed=1, max_batch=128):
+        threading.Thread.__init__(self, name='TiltInput')
+        self.daemon = True
+        self.device = device
+        self.period = 1.0 / output_rate
+        self.read_interval = read_interval
+        self.deadzone = deadzone
+        self.full_angle = full_angle
+        self.max_speed = max_speed
+        self.max_batch = max_batch
+        self.pitch_filter = TiltFilter(sample_rate, max_batch=max_batch)
+        self.roll_filter = TiltFilter(sample_rate, max_batch=max_batch)
+
+        try:
+            self.gyro_resolution = float(device.absinfo(ABS_RX).resolution) or GYRO_RESOLUTION
+        except Exception:
+            self.gyro_resolution = GYRO_RESOLUTION
+
+        # Preallocated sample buffers, filled from the raw events
+        self.ax = array('d', [0.0] * max_batch)
+        self.ay = array('d', [0.0] * max_batch)
+        self.az = array('d', [0.0] * max_batch)
+        self.pitch_rates = array('d', [0.0] * max_batch)
+        self.roll_rates = array('d', [0.0] * max_batch)
+        self.count = 0
+        self._sample = [0, 0, 0, 0, 0, 0]
+
+        self.pitch_offset = None
+        self.roll_offset = None
+        self.pitch_speed = 0
+        self.roll_speed = 0
+        self.running = True
+
+    def handle_events(self, events):
+        """ collect samples from raw events, filtering whenever the buffers are full """
+        sample = self._sample
+        for event in events:
+            if event.type == EV_ABS and event.code <= ABS_RZ:
+                sample[event.code] = event.value
+            elif event.type == EV_SYN:
+                i = self.count
+                self.ax[i] = sample[ABS_X]
+                self.ay[i] = sample[ABS_Y]
+                self.az[i] = sample[ABS_Z]
+                self.pitch_rates[i] = sample[ABS_RX] / self.gyro_resolution
+                self.roll_rates[i] = sample[ABS_RZ] / self.gyro_resolution
+                self.count += 1
+                if self.count == self.max_batch:
+                    self.filter_batch()
+
+    def filter_batch(self):
+        n = self.count
+        if not n:
+            return
+        pitch_angles = array('d', map(math.degrees, map(math.atan2, self.az[:n], self.ay[:n])))
+        roll_angles = array('d', map(math.degrees, map(math.atan2, self.ax[:n], self.ay[:n])))
+        self.pitch_filter.update(self.pitch_rates, pitch_angles, n)
+        self.roll_filter.update(self.roll_rates, roll_angles, n)
+        self.count = 0
+
+    def update_speeds(self):
+        """ turn the filtered angles into speeds, relative to how the controller was held at the start """
+        if self.pitch_filter.angle is None:
+            return
+        if self.pitch_offset is None:
+            self.recenter()
+        self.pitch_speed = tilt_to_speed(self.pitch_filter.angle - self.pitch_offset,
+                                         self.deadzone, self.full_angle, self.max_speed)
+        self.roll_speed = tilt_to_speed(self.roll_filter.angle - self.roll_offset,
+                                        self.deadzone, self.full_angle, self.max_speed)
+
+    def recenter(self):
+        """ use the current controller orientation as neutral """
+        self.pitch_offset = self.pitch_filter.angle
+        self.roll_offset = self.roll_filter.angle
+
+    def run(self):
+        next_output = time.time() + self.period
+        while self.running:
+            # Let events queue up in the kernel buffer, then drain them all in one go. Reading more
+            # often than we publish keeps that (small) buffer from overflowing.
+            time.sleep(self.read_interval)
+            try:
+                self.handle_events(self.device.read())
+            except BlockingIOError:
+                pass  # nothing new
+            except OSError:
+                if not self.running:
+                    break  # the device got closed on shutdown
+                raise
+            now = time.time()
+            if now >= next_output:
+                self.filter_batch()
+                self.update_speeds()
+                next_output = now + self.period
+
+    def stop(self):
+        self.running = False
+        self.pitch_speed = 0
+        self.roll_speed = 0